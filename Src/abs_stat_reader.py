@@ -0,0 +1,124 @@
+import pandas as pd
+
+from census_schema import iter_census_csv
+
+
+## Streaming reads of ABS.Stat extracts like Weekly-Income-By-SA3-2011.csv.
+## These are full dumps with a code and a label column for every dimension
+## (MEASURE/Age, SEX/Sex, STATE/State, REGIONTYPE, REGION/Region, TIME) and
+## one count per row, and we only ever want a few slices of them. The file is
+## read in chunks, each chunk is filtered as soon as it's parsed, and counts are
+## summed into per region histograms as we go, so memory is bounded by the
+## chunk size and the output rather than the file.
+
+CHUNKSIZE = 250_000
+
+# {filter name: ABS.Stat column it filters on}
+ABS_STAT_DIMENSIONS = {
+    'state': 'STATE',
+    'region_type': 'REGIONTYPE',
+    'year': 'TIME',
+    'sex': 'Sex',
+    'age': 'Age',
+}
+
+BRACKET_CODE_COLUMN = 'INCP'
+BRACKET_COLUMN = 'Total Personal Income (weekly)'
+# Bracket codes that aren't part of the distribution, 'TOT' is the sum of the others
+NON_BRACKET_CODES = ['TOT']
+# {ABS.Stat column: its total categories}. Persons (SEX 3) is Males + Females and
+# '15 years and over' is the sum of the age groups, so summing over a dimension
+# that still holds its total would count every person more than once
+AGGREGATE_VALUES = {
+    'Sex': ['Persons'],
+    'Age': ['15 years and over'],
+}
+
+
+def abs_stat_filters(state=None, region_type=None, year=None, sex=None, age=None):
+    # {ABS.Stat column: allowed values} for the dimensions given, e.g.
+    # abs_stat_filters(state=2, region_type='SA3', sex='Persons', age=['20 - 24', '25 - 34'])
+    requested = {'state': state, 'region_type': region_type, 'year': year, 'sex': sex, 'age': age}
+    return {
+        ABS_STAT_DIMENSIONS[name]: values if isinstance(values, (list, tuple, set)) else [values]
+        for name, values in requested.items()
+        if values is not None
+    }
+
+
+def aggregate_exclusions(filters):
+    # {column: total categories to drop} for every dimension in AGGREGATE_VALUES
+    # that filters don't narrow to its totals. Raises ValueError if filters pick
+    # both a total and some of its parts, since those can't be summed
+    exclusions = {}
+    for column, totals in AGGREGATE_VALUES.items():
+        selected = set(filters.get(column, []))
+        if selected and selected <= set(totals):
+            continue
+        if selected & set(totals):
+            raise ValueError('Filters on {} mix the totals {} with their parts {}'.format(
+                column, sorted(selected & set(totals)), sorted(selected - set(totals))
+            ))
+        exclusions[column] = totals
+    return exclusions
+
+
+def filter_chunk(chunk, filters):
+    keep = pd.Series(True, index=chunk.index)
+    for column, values in filters.items():
+        keep &= chunk[column].isin(values)
+    return chunk.loc[keep]
+
+
+def stream_abs_stat_csv(dataset='weekly-income-sa3', filters=None, columns=None, chunksize=CHUNKSIZE, path=None):
+    # Yields the rows matching filters ({column: allowed values}), a chunk at a time.
+    # Filter columns are read even if they aren't in columns, but aren't yielded
+    filters = filters or {}
+    read_columns = None
+    if columns is not None:
+        read_columns = list(columns) + [column for column in filters if column not in columns]
+    for chunk in iter_census_csv(dataset, chunksize, columns=read_columns, path=path):
+        chunk = filter_chunk(chunk, filters)
+        if len(chunk):
+            yield chunk if columns is None else chunk.loc[:, list(columns)]
+
+
+def income_bracket_histograms(filters=None, regions=('REGION', 'Region'), dataset='weekly-income-sa3',
+                              chunksize=CHUNKSIZE, path=None):
+    # Regions x income brackets of summed counts over the rows matching filters,
+    # with the brackets in ABS order (by bracket code). The total sex and age
+    # categories are left out unless filters select only them, so each person is
+    # counted once (e.g. sex='Persons' sums the age groups of Persons)
+    regions = list(regions)
+    counts_srs = None
+    bracket_labels = {}
+    exclusions = aggregate_exclusions(filters or {})
+    columns = regions + [BRACKET_CODE_COLUMN, BRACKET_COLUMN, 'Value']
+    columns += [column for column in exclusions if column not in columns]
+    for chunk in stream_abs_stat_csv(dataset, filters, columns, chunksize, path):
+        keep = ~chunk[BRACKET_CODE_COLUMN].isin(NON_BRACKET_CODES)
+        for column, totals in exclusions.items():
+            keep &= ~chunk[column].isin(totals)
+        chunk = chunk.loc[keep]
+        codes_df = chunk.drop_duplicates(BRACKET_CODE_COLUMN)
+        bracket_labels.update(zip(codes_df[BRACKET_CODE_COLUMN].astype(str), codes_df[BRACKET_COLUMN].astype(str)))
+
+        # Plain string keys so chunks with different categories line up when added
+        chunk_counts_srs = chunk.groupby(regions + [BRACKET_CODE_COLUMN], observed=True)['Value'].sum()
+        chunk_counts_srs.index = pd.MultiIndex.from_arrays([
+            level_values.astype(object) if isinstance(level_values, pd.CategoricalIndex) else level_values
+            for level_values in map(chunk_counts_srs.index.get_level_values, range(chunk_counts_srs.index.nlevels))
+        ])
+        if counts_srs is None:
+            counts_srs = chunk_counts_srs
+        else:
+            counts_srs = counts_srs.add(chunk_counts_srs, fill_value=0)
+
+    if counts_srs is None:
+        return pd.DataFrame(columns=pd.Index([], name=BRACKET_COLUMN))
+    histogram_df = counts_srs.astype('int64').unstack(BRACKET_CODE_COLUMN, fill_value=0).sort_index(axis=1)
+    # Labels are padded with spaces in the extracts
+    histogram_df.columns = pd.Index(
+        [bracket_labels[code].strip() for code in histogram_df.columns], name=BRACKET_COLUMN
+    )
+    return histogram_df
@@ -0,0 +1,99 @@
+import os
+import json
+from functools import lru_cache
+
+import pandas as pd
+
+import dataset_store
+
+
+## Lookups from the 'ugly' AURIN attribute names to their human readable
+## titles. Each -metadata.json is parsed once per process (and again only if
+## it changes on disk), and csvs are read with every rename applied in one go.
+## Once compile_datasets.py has run, the renamed frames are read from the
+## compiled store instead (see dataset_store.py) until the csv or metadata changes.
+
+def metadata_path_for(data_path):
+    return str(data_path)[0:-4] + '-metadata.json'
+
+
+@lru_cache(maxsize=None)
+def _load_metadata_index(metadata_path, mtime_ns):
+    with open(metadata_path) as file:
+        metadata = json.load(file)
+    titles = {}
+    for attribute in metadata['selectedAttributes']:
+        # First match wins, same as scanning the attribute list in order
+        titles.setdefault(attribute['name'], attribute['title'])
+    return titles, metadata.get('key')
+
+
+def get_metadata_index(metadata_path):
+    # Returns ({attribute name: title}, name of the key column)
+    metadata_path = str(metadata_path)
+    return _load_metadata_index(metadata_path, os.stat(metadata_path).st_mtime_ns)
+
+
+def get_column_titles(data_path, headings):
+    # {csv heading: title} for every heading with a matching attribute.
+    # Headings are matched with their whitespace removed
+    titles, _ = get_metadata_index(metadata_path_for(data_path))
+    return {
+        heading: titles[heading.replace(' ', '')]
+        for heading in headings
+        if heading.replace(' ', '') in titles
+    }
+
+
+def aurin_usecols(data_path, headings, columns):
+    # The headings of columns (by attribute name or title) plus the key column, in file order
+    column_titles = get_column_titles(data_path, headings)
+    _, key_name = get_metadata_index(metadata_path_for(data_path))
+    wanted = set(columns)
+    return [
+        heading for heading in headings
+        if heading.replace(' ', '') == key_name
+        or heading in wanted
+        or heading.replace(' ', '') in wanted
+        or column_titles.get(heading) in wanted
+    ]
+
+
+def compiled_aurin_entry(data_path):
+    # Store entry of the compiled csv, or None if it or its metadata changed since it was compiled
+    return dataset_store.compiled_entry([data_path, metadata_path_for(data_path)], 'aurin')
+
+
+def read_aurin_csv(data_path, columns=None, use_store=True, **read_csv_kwargs):
+    # Read an AURIN csv with human readable column names. If columns is given,
+    # only those columns (by attribute name or title) plus the key column are parsed.
+    # Compiled frames were read with the default read_csv arguments, so other ones go to the csv
+    entry = compiled_aurin_entry(data_path) if use_store and not read_csv_kwargs else None
+    if entry is not None:
+        # The compiled columns are the renamed csv headings, in the same order
+        renamed = dict(zip(entry['headings'], entry['columns']))
+        selected = None
+        if columns is not None:
+            selected = [renamed[heading] for heading in aurin_usecols(data_path, entry['headings'], columns)]
+        return dataset_store.read_compiled(entry, selected)
+
+    if columns is not None:
+        headings = pd.read_csv(data_path, nrows=0).columns
+        read_csv_kwargs['usecols'] = aurin_usecols(data_path, headings, columns)
+
+    df = pd.read_csv(data_path, **read_csv_kwargs)
+    df.rename(columns=get_column_titles(data_path, df.columns), inplace=True)
+    return df
+
+
+def compile_aurin_csv(data_path):
+    # Parse an AURIN csv with its titles applied into the compiled store
+    headings = list(pd.read_csv(data_path, nrows=0).columns)
+    df = read_aurin_csv(data_path, use_store=False)
+    if df.columns.duplicated().any():
+        raise ValueError('{} has more than one column titled {}'.format(
+            data_path, sorted(set(df.columns[df.columns.duplicated()]))
+        ))
+    return dataset_store.write_compiled(
+        [data_path, metadata_path_for(data_path)], 'aurin', df, headings=headings, columns=list(df.columns)
+    )
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import paths
+from synthetic_census import generate_datasets
+
+
+## Benchmarks of the pipeline stages on synthetic data, from the Melbourne
+## sized data we have now up to every SA2 in Australia over several censuses.
+## Each scale is generated into a scratch copy of the project (a synthetic
+## Datasets/ and a copy of Src/) and its stages run there in a fresh process,
+## so the scripts run unmodified and no caches carry over between scales.
+## Results are written as json for tracking regressions and scaling curves, e.g.
+## python benchmark.py --scales melbourne australia --repeats 5
+
+SCALES = {
+    'melbourne': {'n_sa2': 300, 'census_years': [2006, 2011, 2016]},
+    'victoria': {'n_sa2': 460, 'census_years': [2006, 2011, 2016]},
+    'australia': {'n_sa2': 2300, 'census_years': [2001, 2006, 2011, 2016]},
+    'australia-1991': {'n_sa2': 2300, 'census_years': [1991, 1996, 2001, 2006, 2011, 2016]},
+}
+
+STAGES = [
+    'calculate_average_bedrooms_df',
+    'calculate_average_rent',
+    'calculate_average_rent_partitioned',
+    'predict_rent_2021',
+    'get_aedc_data',
+    'find_correlations',
+]
+
+BENCHMARK_JSON = paths.ROOT_DIR / 'benchmark-results.json'
+
+
+def measure(function, repeats):
+    # Wall times of repeats calls, then one more call traced for peak Python heap use
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {
+        'seconds': seconds,
+        'median_seconds': statistics.median(seconds),
+        'min_seconds': min(seconds),
+        'peak_mb': peak_bytes / 2**20,
+    }
+
+
+def run_stages(repeats):
+    # Runs in the scratch copy of Src/, which resolves its data from the scratch project
+    import rent_proportion_processor as processor
+    import rent_proportion_analysis as analysis
+    import find_correlations as correlations
+    import frame_cache
+
+    results = {}
+    average_bedrooms_df, results['calculate_average_bedrooms_df'] = measure(
+        processor.calculate_average_bedrooms_df, repeats
+    )
+    average_rent_df, results['calculate_average_rent'] = measure(
+        lambda: processor.calculate_average_rent(average_bedrooms_df), repeats
+    )
+    _, results['calculate_average_rent_partitioned'] = measure(
+        processor.calculate_average_rent_partitioned, repeats
+    )
+    cost_of_living_df = processor.build_cost_of_living_df(average_rent_df.reset_index())
+    _, results['predict_rent_2021'] = measure(
+        lambda: analysis.predict_rent_2021(cost_of_living_df), repeats
+    )
+
+    def cold_get_aedc_data():
+        # Time the full load, not the in memory or on disk caches
+        correlations._aedc_data.clear()
+        shutil.rmtree(frame_cache.CACHE_DIR, ignore_errors=True)
+        return correlations.get_aedc_data()
+    _, results['get_aedc_data'] = measure(cold_get_aedc_data, repeats)
+
+    data = correlations.get_LIHS_data('2016')
+    income = correlations.get_income_data('2016')
+    # Plots are only specced, not rendered
+    _, results['find_correlations'] = measure(
+        lambda: correlations.find_correlations(data, income, '2016', plot_specs=[]), repeats
+    )
+    return results
+
+
+def benchmark_scale(scale, repeats, seed=0, keep=False):
+    # Generates the scale's data in a scratch project and runs the stages in a new process there
+    scratch_dir = Path(tempfile.mkdtemp(prefix='lihs-benchmark-{}-'.format(scale)))
+    try:
+        scratch_src_dir = scratch_dir / 'Src'
+        scratch_src_dir.mkdir()
+        for source in Path(__file__).parent.glob('*.py'):
+            shutil.copy2(source, scratch_src_dir)
+
+        start = time.perf_counter()
+        rows = generate_datasets(scratch_dir / 'Datasets', seed=seed, **SCALES[scale])
+        generate_seconds = time.perf_counter() - start
+
+        completed = subprocess.run(
+            [sys.executable, str(scratch_src_dir / 'benchmark.py'), '--run-stages', '--repeats', str(repeats)],
+            cwd=scratch_src_dir, capture_output=True, text=True,
+            env=dict(os.environ, **{paths.DATA_ROOT_ENV_VAR: str(scratch_dir)})
+        )
+        if completed.returncode != 0:
+            raise RuntimeError('Benchmark of {} failed:\n{}'.format(scale, completed.stderr))
+        worker = json.loads(completed.stdout.splitlines()[-1])
+    finally:
+        if keep:
+            print('Kept {} data in {}'.format(scale, scratch_dir), file=sys.stderr)
+        else:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return [
+        dict(
+            scale=scale,
+            stage=stage,
+            generate_seconds=generate_seconds,
+            max_rss_mb=worker['max_rss_mb'],
+            rows=rows,
+            **SCALES[scale],
+            **worker['stages'][stage]
+        )
+        for stage in STAGES
+    ]
+
+
+def environment():
+    return {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time and memory profile the pipeline stages on synthetic data'
+    )
+    parser.add_argument(
+        '--scales',
+        nargs='+',
+        choices=list(SCALES),
+        default=list(SCALES),
+        help='Data sizes to benchmark (default: all)'
+    )
+    parser.add_argument('--repeats', type=int, default=3, help='Timed runs per stage (default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data')
+    parser.add_argument('--output', type=Path, default=BENCHMARK_JSON, help='Where to write the json results')
+    parser.add_argument('--keep', action='store_true', help="Don't delete the generated data")
+    # Used by benchmark_scale to run the stages inside the scratch project
+    parser.add_argument('--run-stages', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_stages:
+        stages = run_stages(args.repeats)
+        # ru_maxrss is in kilobytes on Linux
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(json.dumps({'stages': stages, 'max_rss_mb': max_rss_mb}))
+        return
+
+    results = []
+    for scale in args.scales:
+        scale_results = benchmark_scale(scale, args.repeats, args.seed, args.keep)
+        for result in scale_results:
+            print('{scale:>16} {stage:<30} {median_seconds:8.3f}s {peak_mb:9.1f}MB'.format(**result))
+        results.extend(scale_results)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump({'environment': environment(), 'repeats': args.repeats, 'results': results}, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+## Cost of living proportions for whole tables of benefit scenarios at once.
+## A scenario is a census year, a weekly cost of living (excluding rent) and a
+## fortnightly payment plus rent assistance. The proportion for a region is
+## (mean rent per person + cost of living) / weekly income, so a value >= 1
+## means the payment doesn't cover the cost of living there.
+
+SCENARIO_COLUMNS = ['Census year', 'Cost of living', 'Fortnightly payment', 'Rent assistance']
+
+# The scenarios used for the report, see the Government Payment Guides in Datasets/
+CENSUS_SCENARIOS = pd.DataFrame(
+    [
+        # 2011 Cost of living = 75 [Weekly groceries] + 35 [Misc costs like bills, transport etc.]
+        # 2011 Youth Allowance/Austudy [388.70 + 79.60 = 468.3 a fortnight]
+        ['Youth Allowance', 2011, 110, 388.70, 79.60],
+        # 2011 Newstart [486.60 + 79.60 = 566.2 a fortnight]
+        ['Newstart', 2011, 110, 486.60, 79.60],
+        # 2016 Cost of living = 87.5 [Weekly groceries] + 42.5 [Misc costs like bills, transport etc.]
+        # 2016 Youth Allowance/Austudy/Newstart under 22 [433.20 + 87.07 = 520.27 a fortnight]
+        ['Youth Allowance', 2016, 130, 433.20, 87.07],
+        # 2016 Newstart/Jobseeker over 22 [528.70 + 87.07 = 615.77 a fortnight]
+        ['Newstart', 2016, 130, 528.70, 87.07],
+        # 2021 Cost of living = 100 [Groceries] + 50 [Transport, bills etc.]
+        # 2021 Youth Allowance/Austudy/Jobseeker under 22 [512.50 + 93.87 = 606.37 fortnightly]
+        ['Youth Allowance', 2021, 150, 512.50, 93.87],
+        # 2021 Jobseeker over 22 [620.80 + 93.87 = 714.67 fortnightly]
+        ['Newstart', 2021, 150, 620.80, 93.87],
+    ],
+    columns=['Benefit'] + SCENARIO_COLUMNS
+)
+
+
+def weekly_income(scenarios_df):
+    return (scenarios_df['Fortnightly payment'] + scenarios_df['Rent assistance']) / 2
+
+
+def scenarios_for_year(scenarios_df, year):
+    return scenarios_df.loc[scenarios_df['Census year'] == year, :]
+
+
+def scenario_proportion_matrix(rent_per_person_df, scenarios_df):
+    # Regions x census years, NaN where a region has no rent for that year
+    rent_by_year_df = rent_per_person_df.pivot(
+        index='Region', columns='Census year', values='Mean rent per person'
+    )
+    year_positions = rent_by_year_df.columns.get_indexer(scenarios_df['Census year'])
+    missing_years = scenarios_df['Census year'].values[year_positions < 0]
+    if len(missing_years):
+        raise ValueError('No rent data for census year(s) {}'.format(sorted(set(missing_years))))
+
+    # Broadcast every scenario against every region in one go: regions x scenarios
+    rent = rent_by_year_df.to_numpy(dtype=float)[:, year_positions]
+    cost_of_living = scenarios_df['Cost of living'].to_numpy(dtype=float)
+    income = weekly_income(scenarios_df).to_numpy(dtype=float)
+    proportions = (rent + cost_of_living) / income
+
+    return pd.DataFrame(proportions, index=rent_by_year_df.index, columns=scenarios_df.index)
+
+
+def share_at_least_one(proportion_df):
+    # Share of regions (ignoring ones with no data) where the payment doesn't cover the cost of living
+    proportions = proportion_df.to_numpy(dtype=float)
+    with np.errstate(invalid='ignore'):
+        at_least_one = (proportions >= 1).sum(axis=0)
+    counts = (~np.isnan(proportions)).sum(axis=0)
+    shares = np.divide(
+        at_least_one, counts,
+        out=np.full(len(counts), np.nan),
+        where=counts != 0
+    )
+    return pd.Series(shares, index=proportion_df.columns, name='Share >= 1')
+
+
+def summarise_scenarios(rent_per_person_df, scenarios_df):
+    proportion_df = scenario_proportion_matrix(rent_per_person_df, scenarios_df)
+    summary_df = scenarios_df.copy()
+    summary_df['Weekly income'] = weekly_income(scenarios_df)
+    summary_df['Share >= 1'] = share_at_least_one(proportion_df)
+    return summary_df
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+
+## Distributions estimated from binned census counts, e.g. people per weekly
+## income bracket or rentals per weekly rent bracket. Bracket labels are parsed
+## once into edge arrays, then the mean, median and any quantiles of every group
+## (region x sex x age group, ...) come from a few array operations over a
+## groups x brackets matrix of counts.
+##
+## Each count is assumed to be spread evenly over its bracket, so a label like
+## '$150-$199' covers [150, 200) and has a midpoint of 174.5. Open-ended top
+## brackets ('$950 and over', '$2,000 or more') have no width to spread over,
+## so their counts sit at their lower bound.
+
+BRACKET_PATTERN = r'(\d+)(?:\D+(\d+))?'
+
+
+def parse_brackets(labels, unit=1):
+    # Lower, Upper (exclusive) and Midpoint of each distinct label, indexed by label.
+    # unit is the step between one bracket's stated upper bound and the next's lower bound.
+    # Labels without a value (like 'Not stated') get NaN and are left out of the estimates
+    labels = pd.Index(pd.unique(np.asarray(labels, dtype=object)))
+    stripped = pd.Series(labels.astype(str).str.strip(), index=labels)
+    bounds = stripped.str.replace(',', '', regex=False).str.extract(BRACKET_PATTERN).astype(float)
+    lower, stated_upper = bounds[0], bounds[1]
+
+    # 'Nil income', 'Negative/Nil income' etc. are counted as 0
+    nil = lower.isna() & stripped.str.contains('nil', case=False)
+    lower[nil] = 0
+    stated_upper[nil] = 0
+
+    open_ended = lower.notna() & stated_upper.isna()
+    brackets_df = pd.DataFrame({
+        'Lower': lower,
+        'Upper': np.where(open_ended | nil, lower, stated_upper + unit),
+        'Midpoint': np.where(open_ended, lower, (lower + stated_upper) / 2),
+    })
+    brackets_df.index.name = 'Bracket'
+    return brackets_df
+
+
+def binned_means(counts, midpoints):
+    # counts is groups x brackets, returns the count weighted mean of each group (NaN if empty)
+    counts = np.asarray(counts, dtype=float)
+    totals = counts.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (counts @ np.asarray(midpoints, dtype=float)) / totals
+
+
+def binned_quantiles(counts, lower, upper, quantiles):
+    # counts is groups x brackets with brackets in ascending order, returns the
+    # groups x quantiles estimates, linearly interpolated within each bracket
+    counts = np.asarray(counts, dtype=float)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    quantiles = np.asarray(quantiles, dtype=float)
+
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+    # groups x quantiles count of people below each quantile
+    targets = totals[:, None] * quantiles[None, :]
+    # Bracket each quantile falls in: the first whose cumulative count reaches it.
+    # Empty brackets never hold a quantile, except at 0 where the first non-empty one does
+    reached = (cumulative[:, None, :] >= targets[:, :, None]) & (counts[:, None, :] > 0)
+    bracket = np.argmax(reached, axis=2)
+
+    rows = np.arange(len(counts))[:, None]
+    below = cumulative[rows, bracket] - counts[rows, bracket]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = (targets - below) / counts[rows, bracket]
+    estimates = lower[bracket] + np.clip(fraction, 0, 1) * (upper[bracket] - lower[bracket])
+    estimates[totals == 0, :] = np.nan
+    return estimates
+
+
+def quantile_name(quantile):
+    return 'Median' if quantile == 0.5 else 'Q{:g}'.format(quantile * 100)
+
+
+def summarise_histograms(histogram_df, quantiles=(0.25, 0.5, 0.75), unit=1):
+    # histogram_df is groups x bracket labels of counts (e.g. from
+    # abs_stat_reader.income_bracket_histograms). Returns the Total, Mean and
+    # quantiles of each group
+    brackets_df = parse_brackets(histogram_df.columns, unit)
+    brackets_df = brackets_df.loc[brackets_df['Lower'].notna()].sort_values(['Lower', 'Upper'])
+    counts = histogram_df.loc[:, brackets_df.index].to_numpy(dtype=float)
+
+    summary_df = pd.DataFrame(index=histogram_df.index)
+    summary_df['Total'] = histogram_df.loc[:, brackets_df.index].sum(axis=1)
+    summary_df['Mean'] = binned_means(counts, brackets_df['Midpoint'])
+    estimates = binned_quantiles(counts, brackets_df['Lower'], brackets_df['Upper'], quantiles)
+    for i, quantile in enumerate(quantiles):
+        summary_df[quantile_name(quantile)] = estimates[:, i]
+    return summary_df
+
+
+def summarise_binned_counts(df, by, bracket_col, value_col='Value', quantiles=(0.25, 0.5, 0.75), unit=1):
+    # Same as summarise_histograms, for a long-format table with one count per
+    # row, grouped by the by columns (e.g. ['Region', 'Sex', 'Age'])
+    histogram_df = df.groupby(list(by) + [bracket_col], observed=True, sort=False)[value_col].sum().unstack(
+        bracket_col, fill_value=0
+    )
+    return summarise_histograms(histogram_df, quantiles, unit).sort_index()
@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import paths
+import dataset_store
+
+
+## Typed schemas for the census extracts we load. ABS long-format tables repeat
+## the same handful of labels (regions, dwelling types, brackets) in every row,
+## so dimension columns are read straight into categoricals and values into the
+## narrowest type that holds them. Only the columns a schema declares are parsed,
+## and once compile_datasets.py has run they're read from the compiled store
+## instead (see dataset_store.py) until the csv changes.
+
+# {dataset: {'file': csv name in Datasets/ (may have {fields}), 'read_csv': extra
+# read_csv arguments, 'columns': {column: dtype}}}
+CENSUS_SCHEMAS = {
+    'dwelling': {
+        'file': 'Dwelling-Structure-And-Number-Of-Bedrooms-By-SA2-2006-2011-2016.csv',
+        'read_csv': {'encoding': 'ISO-8859-1'},
+        'columns': {
+            'Number of Bedrooms': 'category',
+            'Dwelling Structure': 'category',
+            'Region': 'category',
+            'Census year': 'int16',
+            'Value': 'int32',
+        },
+    },
+    'rent': {
+        'file': 'Rent-Weekly-By-SA2-Melbourne-2006-2011-2016.csv',
+        'read_csv': {},
+        'columns': {
+            'Dwelling Structure': 'category',
+            'Rent (weekly)': 'category',
+            'Region': 'category',
+            'Census year': 'int16',
+            'Value': 'int32',
+        },
+    },
+    'weekly-income-sa3': {
+        'file': 'Weekly-Income-By-SA3-2011.csv',
+        # ABS.Stat exports start with a byte order mark
+        'read_csv': {'encoding': 'utf-8-sig'},
+        'columns': {
+            'Age': 'category',
+            'SEX': 'int8',
+            'Sex': 'category',
+            'INCP': 'category',
+            'Total Personal Income (weekly)': 'category',
+            'STATE': 'int8',
+            'REGIONTYPE': 'category',
+            'REGION': 'int32',
+            'Region': 'category',
+            'TIME': 'int16',
+            'Value': 'int32',
+        },
+    },
+    'income': {
+        'file': 'income_{year}.csv',
+        'read_csv': {'na_values': 'null'},
+        'columns': {
+            # 9-digit codes fit comfortably in an int32
+            'sa2_maincode_2016': 'int32',
+            # Medians are whole dollars so float32 holds them exactly
+            'equivalised_total_household_income_census_median_weekly': 'float32',
+        },
+    },
+}
+
+
+def census_csv_path(dataset, **file_fields):
+    return paths.DATASETS_DIR / CENSUS_SCHEMAS[dataset]['file'].format(**file_fields)
+
+
+def schema_dtypes(dataset, columns=None):
+    dtypes = CENSUS_SCHEMAS[dataset]['columns']
+    if columns is not None:
+        dtypes = {column: dtypes[column] for column in columns}
+    return dtypes
+
+
+def census_read_csv_args(dataset, columns=None, path=None, **file_fields):
+    # (path, {column: dtype}, {csv heading: column}, read_csv arguments) to read
+    # the schema's columns of a census csv
+    schema = CENSUS_SCHEMAS[dataset]
+    if path is None:
+        path = census_csv_path(dataset, **file_fields)
+    dtypes = schema_dtypes(dataset, columns)
+
+    # Some extracts pad their headings with spaces, so match them stripped
+    headings = pd.read_csv(path, nrows=0, **schema['read_csv']).columns
+    heading_names = {heading: heading.strip() for heading in headings if heading.strip() in dtypes}
+    missing = set(dtypes) - set(heading_names.values())
+    if missing:
+        raise ValueError('{} is missing column(s) {}'.format(path, sorted(missing)))
+
+    read_csv_kwargs = dict(
+        schema['read_csv'],
+        usecols=list(heading_names),
+        dtype={heading: dtypes[name] for heading, name in heading_names.items()}
+    )
+    return path, dtypes, heading_names, read_csv_kwargs
+
+
+def compiled_census_entry(dataset, path=None, **file_fields):
+    # Store entry of the compiled csv, or None if it hasn't been compiled since it last changed
+    if path is None:
+        path = census_csv_path(dataset, **file_fields)
+    return dataset_store.compiled_entry([path], 'census:{}'.format(dataset))
+
+
+def read_census_csv(dataset, columns=None, path=None, use_store=True, **file_fields):
+    # Read a census csv with its schema's dtypes. columns picks a subset of the
+    # schema's columns, and the frame's columns come back in that order
+    entry = compiled_census_entry(dataset, path, **file_fields) if use_store else None
+    if entry is not None:
+        # Compiled frames already have every schema column, with sorted categories
+        return dataset_store.read_compiled(entry, list(schema_dtypes(dataset, columns)))
+
+    path, dtypes, heading_names, read_csv_kwargs = census_read_csv_args(dataset, columns, path, **file_fields)
+    df = pd.read_csv(path, **read_csv_kwargs)
+    df = df.rename(columns=heading_names).loc[:, list(dtypes)]
+    # Categories come back in order of appearance, sort them so groupbys and
+    # sorts order labels the same way they would as strings
+    for column, dtype in dtypes.items():
+        if dtype == 'category':
+            df[column] = df[column].cat.reorder_categories(df[column].cat.categories.sort_values())
+    return df
+
+
+def iter_census_csv(dataset, chunksize, columns=None, path=None, use_store=True, **file_fields):
+    # Same as read_census_csv, but yields frames of at most chunksize rows.
+    # Each chunk has its own categories (all of the file's if it's compiled)
+    entry = compiled_census_entry(dataset, path, **file_fields) if use_store else None
+    if entry is not None:
+        yield from dataset_store.iter_compiled(entry, chunksize, list(schema_dtypes(dataset, columns)))
+        return
+
+    path, dtypes, heading_names, read_csv_kwargs = census_read_csv_args(dataset, columns, path, **file_fields)
+    with pd.read_csv(path, chunksize=chunksize, **read_csv_kwargs) as reader:
+        for chunk in reader:
+            yield chunk.rename(columns=heading_names).loc[:, list(dtypes)]
+
+
+def compile_census_csv(dataset, path=None, **file_fields):
+    # Parse every schema column of a census csv into the compiled store
+    if path is None:
+        path = census_csv_path(dataset, **file_fields)
+    df = read_census_csv(dataset, path=path, use_store=False)
+    return dataset_store.write_compiled([path], 'census:{}'.format(dataset), df)
+
+
+def read_census_csvs(dataset, csv_paths, columns=None, use_store=True):
+    # read_census_csv of several files of the same dataset (e.g. one per city)
+    # stacked into one frame, with the categories of each column merged and sorted.
+    # Rows repeated across files are only kept once
+    frames = [read_census_csv(dataset, columns, path, use_store) for path in csv_paths]
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.DataFrame({
+        column: union_categoricals([frame[column] for frame in frames], sort_categories=True)
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype)
+        else np.concatenate([frame[column].to_numpy() for frame in frames])
+        for column in frames[0].columns
+    })
+    dimension_columns = [column for column in df.columns if column != 'Value']
+    return df.drop_duplicates(dimension_columns, ignore_index=True)
+
+
+def drop_labels(df, labels):
+    # Drop rows where any categorical column holds one of labels (e.g. 'Total'),
+    # then drop the labels from the categories so groupbys don't see them
+    drop = pd.Series(False, index=df.index)
+    categorical_columns = [column for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)]
+    for column in categorical_columns:
+        drop |= df[column].isin(labels)
+    df = df.loc[~drop].dropna()
+    for column in categorical_columns:
+        df[column] = df[column].cat.remove_unused_categories()
+    return df
@@ -0,0 +1,88 @@
+import sys
+import argparse
+
+import paths
+import dataset_store
+from aurin_metadata import compile_aurin_csv, compiled_aurin_entry
+from census_schema import CENSUS_SCHEMAS, compile_census_csv, compiled_census_entry
+
+
+## Compiles the raw csvs the scripts read into the memory mapped store in
+## .cache/compiled/ (see dataset_store.py), so later runs skip text parsing.
+## Only files that changed since they were last compiled are parsed again, and
+## loaders fall back to the csv for anything that's stale or missing, so
+## running this is optional. python compile_datasets.py [--force]
+
+# Census datasets and the {field: values} of the files to compile for each
+CENSUS_FILES = {
+    'dwelling': [{}],
+    'rent': [{}],
+    'weekly-income-sa3': [{}],
+    'income': [{'year': '2011'}, {'year': '2016'}],
+}
+
+# AURIN csvs (with a -metadata.json) to compile, relative to Datasets/
+AURIN_FILES = [
+    'Family-and-Community-*.csv',
+    'Income-Including-Govt-Allowances-*.csv',
+    'AEDC/*.csv',
+]
+
+
+def census_targets(datasets_dir=paths.DATASETS_DIR):
+    # (path, fresh entry lookup, compile function) of each census csv
+    targets = []
+    for dataset, file_fields_list in CENSUS_FILES.items():
+        for file_fields in file_fields_list:
+            path = datasets_dir / CENSUS_SCHEMAS[dataset]['file'].format(**file_fields)
+            targets.append((
+                path,
+                lambda dataset=dataset, path=path: compiled_census_entry(dataset, path),
+                lambda dataset=dataset, path=path: compile_census_csv(dataset, path),
+            ))
+    return targets
+
+
+def aurin_targets(datasets_dir=paths.DATASETS_DIR):
+    return [
+        (path, lambda path=path: compiled_aurin_entry(path), lambda path=path: compile_aurin_csv(path))
+        for pattern in AURIN_FILES
+        for path in sorted(datasets_dir.glob(pattern))
+    ]
+
+
+def compile_datasets(force=False, datasets_dir=paths.DATASETS_DIR):
+    # Compiles every stale or missing file, returns {csv path: 'compiled', 'fresh', 'missing' or the error}
+    results = {}
+    for path, find_entry, compile_file in census_targets(datasets_dir) + aurin_targets(datasets_dir):
+        if not path.exists():
+            results[path] = 'missing'
+        elif not force and find_entry() is not None:
+            results[path] = 'fresh'
+        else:
+            try:
+                compile_file()
+                results[path] = 'compiled'
+            except ValueError as error:
+                # Loaders keep reading this one from the csv
+                results[path] = str(error)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compile the raw datasets into a memory mapped columnar store for faster loading'
+    )
+    parser.add_argument('--force', action='store_true', help='Recompile files even if they are fresh')
+    args = parser.parse_args(argv)
+
+    for path, result in compile_datasets(args.force).items():
+        if result in ('compiled', 'fresh', 'missing'):
+            print('{:<10} {}'.format(result, path.relative_to(paths.DATASETS_DIR)))
+        else:
+            print('{:<10} {}: {}'.format('skipped', path.relative_to(paths.DATASETS_DIR), result), file=sys.stderr)
+    print('Compiled datasets are in {}'.format(dataset_store.STORE_DIR))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+
+
+## Pearson and Spearman correlations of every metric against every income
+## measure at once. Missing values are handled pairwise (like corrwith): each
+## pair only uses the SA2s where both are present. Instead of looping over
+## pairs, the sums needed for each pair are built with a handful of matrix
+## products over the present/missing masks.
+
+MIN_PERIODS = 2
+
+
+def centre_present(values):
+    # Centres each column on the mean of its present values and zeros the missing
+    # ones. Returns the centred values and a float mask of the present ones.
+    # Centring doesn't change any correlation but keeps the sums well conditioned
+    present = ~np.isnan(values)
+    with warnings.catch_warnings():
+        # All missing columns give a NaN mean, which is fine as they're all masked out
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        centred = np.where(present, values - np.nanmean(values, axis=0), 0)
+    return centred, present.astype(float)
+
+
+def pairwise_correlation(x, y, min_periods=MIN_PERIODS):
+    # x is n x p, y is n x q, both float arrays with NaN for missing values.
+    # Returns the p x q correlations and the p x q number of SA2s used for each
+    x, x_mask = centre_present(x)
+    y, y_mask = centre_present(y)
+
+    counts = x_mask.T @ y_mask
+    sum_x = x.T @ y_mask
+    sum_y = x_mask.T @ y
+    sum_xx = (x * x).T @ y_mask
+    sum_yy = x_mask.T @ (y * y)
+    sum_xy = x.T @ y
+    return correlation_from_sums(counts, sum_x, sum_y, sum_xx, sum_yy, sum_xy, min_periods), counts.astype(int)
+
+
+def correlation_from_sums(counts, sum_x, sum_y, sum_xx, sum_yy, sum_xy, min_periods=MIN_PERIODS):
+    # Pearson r from the (elementwise) sums over the values used for each pair
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = counts * sum_xy - sum_x * sum_y
+        variance_x = counts * sum_xx - sum_x * sum_x
+        variance_y = counts * sum_yy - sum_y * sum_y
+        correlations = covariance / np.sqrt(variance_x * variance_y)
+    correlations[(counts < min_periods) | (variance_x <= 0) | (variance_y <= 0)] = np.nan
+    return np.clip(correlations, -1, 1)
+
+
+def missing_patterns(values):
+    # [(present mask, columns with that mask)] for each distinct pattern of missing values
+    present = ~np.isnan(values)
+    patterns, inverse = np.unique(present.T, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    return [(pattern, np.flatnonzero(inverse == i)) for i, pattern in enumerate(patterns)]
+
+
+def sort_columns(values):
+    # Each column's row order from smallest to largest (missing last), and for
+    # every sorted position the first and one past the last sorted position of
+    # the group of tied values it's in
+    n_rows = len(values)
+    order = np.argsort(values, axis=0, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    positions = np.arange(n_rows)[:, None]
+    starts_group = np.ones(values.shape, dtype=bool)
+    starts_group[1:] = sorted_values[1:] != sorted_values[:-1]
+    ends_group = np.ones(values.shape, dtype=bool)
+    ends_group[:-1] = starts_group[1:]
+    group_start = np.maximum.accumulate(np.where(starts_group, positions, 0), axis=0)
+    group_stop = np.minimum.accumulate(np.where(ends_group, positions, n_rows - 1)[::-1], axis=0)[::-1] + 1
+    return order, group_start, group_stop
+
+
+def ranks_within(sorted_columns, present):
+    # Average ranks (like DataFrame.rank) of each column over only its rows in
+    # present, NaN elsewhere. sorted_columns is from sort_columns, either for the
+    # same columns as present or for one column to rank over each of present's.
+    # A rank is the count of present rows below a value's group of ties plus half
+    # of those in it, so the sort is done once and each mask only costs a cumsum
+    order, group_start, group_stop = sorted_columns
+    n_columns = present.shape[1]
+    single_column = order.shape[1] == 1
+    if single_column:
+        def gather(values, positions):
+            return values[positions[:, 0]]
+    else:
+        # Flat indices, which numpy gathers a lot faster than pairs of row and column indices
+        columns = np.arange(n_columns)
+
+        def gather(values, positions):
+            return values.ravel()[positions * n_columns + columns]
+
+    present_sorted = gather(present, order)
+    # present_before[k] is the number of present rows in sorted positions before k
+    present_before = np.zeros((len(present) + 1, n_columns))
+    np.cumsum(present_sorted, axis=0, out=present_before[1:])
+    below = gather(present_before, group_start)
+    tied = gather(present_before, group_stop) - below
+    ranks_sorted = np.where(present_sorted, below + (tied + 1) / 2, np.nan)
+
+    ranks = np.empty(present.shape)
+    if single_column:
+        ranks[order[:, 0]] = ranks_sorted
+    else:
+        ranks.ravel()[order * n_columns + columns] = ranks_sorted
+    return ranks
+
+
+def columnwise_correlation(x, y, min_periods=MIN_PERIODS):
+    # Pearson r of each column of x with the same column of y (or with y's only
+    # column), where both are missing in the same places
+    x, present = centre_present(x)
+    y, _ = centre_present(y)
+    y = y * present
+    counts = present.sum(axis=0)
+    return correlation_from_sums(
+        counts, x.sum(axis=0), y.sum(axis=0), (x * x).sum(axis=0), (y * y).sum(axis=0), (x * y).sum(axis=0),
+        min_periods
+    )
+
+
+def pairwise_spearman(x, y, min_periods=MIN_PERIODS):
+    # Spearman is Pearson on the ranks, with both columns of a pair ranked over
+    # only the SA2s where both are present (like DataFrame.corr). Each pair can
+    # have its own SA2s when gaps are scattered, so rather than ranking pair by
+    # pair, every column is sorted once and ranks_within re-ranks it for each
+    # mask. The side with fewer columns is walked a pattern of missing values at
+    # a time, and every column of the other side is ranked over that pattern at
+    # once. Where the other side has gaps inside the pattern, each of the
+    # pattern's columns is then ranked over every pair's SA2s at once
+    if x.shape[1] < y.shape[1]:
+        return pairwise_spearman(y, x, min_periods).T
+    x_present = ~np.isnan(x)
+    x_sorted = sort_columns(x)
+    y_sorted = sort_columns(y)
+    spearman = np.full((x.shape[1], y.shape[1]), np.nan)
+    for y_present, y_columns in missing_patterns(y):
+        pairs_present = x_present & y_present[:, None]
+        x_ranks = ranks_within(x_sorted, pairs_present)
+        if (pairs_present == y_present[:, None]).all():
+            # Every pair uses the pattern's SA2s, so the pattern is one block
+            pattern_sorted = tuple(positions[:, y_columns] for positions in y_sorted)
+            y_ranks = ranks_within(pattern_sorted, np.repeat(y_present[:, None], len(y_columns), axis=1))
+            spearman[:, y_columns], _ = pairwise_correlation(x_ranks, y_ranks, min_periods)
+            continue
+        for column in y_columns:
+            column_sorted = tuple(positions[:, [column]] for positions in y_sorted)
+            y_ranks = ranks_within(column_sorted, pairs_present)
+            spearman[:, column] = columnwise_correlation(x_ranks, y_ranks, min_periods)
+    return spearman
+
+
+def align_on_sa2(metrics_df, income_df):
+    # Align both frames to the SA2 codes they share, once for every pair
+    sa2_codes = metrics_df.index.intersection(income_df.index).sort_values()
+    metrics_df = metrics_df.select_dtypes('number').reindex(sa2_codes)
+    income_df = income_df.select_dtypes('number').reindex(sa2_codes)
+    return metrics_df, income_df
+
+
+@instrumented
+def pearson_matrices(metrics_df, income_df, min_periods=MIN_PERIODS):
+    # Returns metrics x income measures frames of Pearson r and SA2 counts, for
+    # callers that don't need Spearman and shouldn't pay for the ranking
+    metrics_df, income_df = align_on_sa2(metrics_df, income_df)
+    pearson, counts = pairwise_correlation(
+        metrics_df.to_numpy(dtype=float), income_df.to_numpy(dtype=float), min_periods
+    )
+
+    def to_frame(values):
+        return pd.DataFrame(values, index=metrics_df.columns, columns=income_df.columns)
+
+    return to_frame(pearson), to_frame(counts)
+
+
+@instrumented
+def correlation_matrices(metrics_df, income_df, min_periods=MIN_PERIODS):
+    # Returns metrics x income measures frames of Pearson r, Spearman rho and SA2 counts
+    metrics_df, income_df = align_on_sa2(metrics_df, income_df)
+
+    pearson, counts = pairwise_correlation(
+        metrics_df.to_numpy(dtype=float), income_df.to_numpy(dtype=float), min_periods
+    )
+    spearman = pairwise_spearman(metrics_df.to_numpy(dtype=float), income_df.to_numpy(dtype=float), min_periods)
+
+    def to_frame(values):
+        return pd.DataFrame(values, index=metrics_df.columns, columns=income_df.columns)
+
+    return to_frame(pearson), to_frame(spearman), to_frame(counts)
+
+
+def correlation_table(metrics_df, income_df, min_periods=MIN_PERIODS):
+    # Tidy long table with one row per metric and income measure
+    pearson_df, spearman_df, counts_df = correlation_matrices(metrics_df, income_df, min_periods)
+    n_metrics, n_measures = pearson_df.shape
+
+    # Row i * n_measures + j is metric i against measure j
+    table = pd.DataFrame({
+        pearson_df.index.name or 'LIHS Metric': np.repeat(pearson_df.index.to_numpy(), n_measures)
+    })
+    for level, name in enumerate(pearson_df.columns.names):
+        level_values = pearson_df.columns.get_level_values(level).to_numpy()
+        table[name or 'Income Measure'] = np.tile(level_values, n_metrics)
+    table['Pearson'] = pearson_df.to_numpy().ravel()
+    table['Spearman'] = spearman_df.to_numpy().ravel()
+    table['SA2 Count'] = counts_df.to_numpy().ravel()
+    return table
@@ -0,0 +1,138 @@
+import math
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from correlation_engine import align_on_sa2, centre_present, correlation_from_sums, pairwise_correlation
+from instrumentation import instrumented
+
+
+## Bootstrap confidence intervals and permutation p-values for the correlation
+## of every metric against one income measure. Resamples are done for all the
+## metrics together: a bootstrap resample is a row of counts (how many times
+## each SA2 was drawn) and a permutation is a shuffled copy of the income, so a
+## batch of resamples turns into a handful of (resamples x SA2s) @ (SA2s x
+## metrics) matrix products. Missing values are handled pairwise as in
+## correlation_engine.py.
+##
+## Resamples are split into fixed size shards, each with its own child of the
+## seed, so results are the same whatever the number of worker processes.
+
+SEED = 2021
+N_BOOTSTRAP = 2000
+N_PERMUTATIONS = 2000
+CONFIDENCE = 0.95
+SHARD_SIZE = 250
+
+
+def bootstrap_correlations(x, y, n_resamples, rng):
+    # x is SA2s x metrics, y is SA2s, both with NaN for missing values.
+    # Returns resamples x metrics correlations
+    x, x_mask = centre_present(x)
+    y, y_mask = centre_present(y)
+    # Only SA2s with both values count towards each metric
+    x = x * y_mask[:, None]
+    both_mask = x_mask * y_mask[:, None]
+    y_both = y[:, None] * both_mask
+
+    n = len(y)
+    weights = rng.multinomial(n, np.full(n, 1 / n), size=n_resamples).astype(float)
+    return correlation_from_sums(
+        weights @ both_mask,
+        weights @ x,
+        weights @ y_both,
+        weights @ (x * x),
+        weights @ (y_both * y[:, None]),
+        weights @ (x * y[:, None])
+    )
+
+
+def permutation_correlations(x, y, n_permutations, rng):
+    # Same as bootstrap_correlations, with y shuffled across the SA2s for each permutation
+    x, x_mask = centre_present(x)
+    y, y_mask = centre_present(y)
+
+    n = len(y)
+    permutations = rng.permuted(np.tile(np.arange(n), (n_permutations, 1)), axis=1)
+    y_permuted = y[permutations]
+    y_mask_permuted = y_mask[permutations]
+    return correlation_from_sums(
+        y_mask_permuted @ x_mask,
+        y_mask_permuted @ x,
+        y_permuted @ x_mask,
+        y_mask_permuted @ (x * x),
+        (y_permuted * y_permuted) @ x_mask,
+        y_permuted @ x
+    )
+
+
+def resample_shard(shard):
+    resample, x, y, n_resamples, seed_sequence = shard
+    return resample(x, y, n_resamples, np.random.default_rng(seed_sequence))
+
+
+def resampled_correlations(resample, x, y, n_resamples, seed_sequence, executor=None):
+    # Runs resample over shards of at most SHARD_SIZE resamples, on executor if given
+    n_shards = math.ceil(n_resamples / SHARD_SIZE)
+    shards = [
+        (resample, x, y, min(SHARD_SIZE, n_resamples - i * SHARD_SIZE), child_sequence)
+        for i, child_sequence in enumerate(seed_sequence.spawn(n_shards))
+    ]
+    mapper = map if executor is None else executor.map
+    return np.concatenate(list(mapper(resample_shard, shards)), axis=0)
+
+
+def benjamini_hochberg(p_values):
+    # False discovery rate adjusted p-values, NaNs are left out and kept as NaN
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full(len(p_values), np.nan)
+    present = np.flatnonzero(~np.isnan(p_values))
+    order = present[np.argsort(p_values[present])]
+    ranked = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    # Each adjusted p-value is the smallest of those ranked at or above it
+    adjusted[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return adjusted
+
+
+@instrumented
+def correlation_significance(metrics_df, income_srs, n_bootstrap=N_BOOTSTRAP, n_permutations=N_PERMUTATIONS,
+                             confidence=CONFIDENCE, seed=SEED, max_workers=None):
+    # Per metric percentile bootstrap CI of Pearson r against income_srs, two
+    # sided permutation p-value and Benjamini-Hochberg adjusted p-value
+    metrics_df, income_df = align_on_sa2(metrics_df, income_srs.to_frame())
+    x = metrics_df.to_numpy(dtype=float)
+    y = income_df.iloc[:, 0].to_numpy(dtype=float)
+    observed = pairwise_correlation(x, y[:, None])[0][:, 0]
+
+    bootstrap_sequence, permutation_sequence = np.random.SeedSequence(seed).spawn(2)
+    if max_workers == 1:
+        bootstrap = resampled_correlations(bootstrap_correlations, x, y, n_bootstrap, bootstrap_sequence)
+        permuted = resampled_correlations(permutation_correlations, x, y, n_permutations, permutation_sequence)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            bootstrap = resampled_correlations(
+                bootstrap_correlations, x, y, n_bootstrap, bootstrap_sequence, executor
+            )
+            permuted = resampled_correlations(
+                permutation_correlations, x, y, n_permutations, permutation_sequence, executor
+            )
+
+    tail = (1 - confidence) / 2
+    with warnings.catch_warnings(), np.errstate(invalid='ignore'):
+        # Metrics with no data at all have no CI
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        ci_low, ci_high = np.nanquantile(bootstrap, [tail, 1 - tail], axis=0)
+        # Resamples where a metric had no variance give NaN and aren't counted
+        as_extreme = (np.abs(permuted) >= np.abs(observed) - 1e-12).sum(axis=0)
+    valid_permutations = (~np.isnan(permuted)).sum(axis=0)
+    p_values = (as_extreme + 1) / (valid_permutations + 1)
+    p_values[np.isnan(observed)] = np.nan
+
+    return pd.DataFrame({
+        'CI Low': ci_low,
+        'CI High': ci_high,
+        'p-value': p_values,
+        'Adjusted p-value': benjamini_hochberg(p_values),
+    }, index=metrics_df.columns)
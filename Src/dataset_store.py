@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import paths
+from frame_cache import atomic_write, file_digest
+
+
+## Compiled copies of the raw datasets. compile_datasets.py parses each csv
+## once, with its schema dtypes or metadata titles applied, and writes it here
+## as an uncompressed Arrow (Feather v2) file. Loaders open those through a
+## memory map, so columns come straight from the page cache instead of being
+## parsed from text on every run. The manifest records the size, modification
+## time and digest of every file a compiled frame was built from (the csv and
+## its -metadata.json), and a compiled frame is only used while they match.
+
+STORE_DIR = paths.CACHE_DIR / 'compiled'
+MANIFEST_PATH = STORE_DIR / 'manifest.json'
+
+# Bump this if a change to the readers should invalidate every compiled file
+STORE_VERSION = 1
+
+# The manifest as last read, with the (mtime, size) of the file it was read from
+_manifest = {'stat': None, 'entries': {}}
+
+
+def entry_name(source_path, reader):
+    # Manifest key of a csv as compiled by one of the readers (e.g. 'aurin' or 'census:income')
+    return '{}|{}'.format(reader, Path(source_path).resolve())
+
+
+def load_manifest():
+    # {entry name: entry}, re-read only when the manifest file changes
+    try:
+        stat = os.stat(MANIFEST_PATH)
+    except FileNotFoundError:
+        return {}
+    if _manifest['stat'] != (stat.st_mtime_ns, stat.st_size):
+        with open(MANIFEST_PATH) as file:
+            manifest = json.load(file)
+        _manifest['entries'] = manifest['entries'] if manifest.get('version') == STORE_VERSION else {}
+        _manifest['stat'] = (stat.st_mtime_ns, stat.st_size)
+    return _manifest['entries']
+
+
+def save_manifest(entries):
+    with atomic_write(MANIFEST_PATH) as temp_path, open(temp_path, 'w') as file:
+        json.dump({'version': STORE_VERSION, 'entries': entries}, file, indent=1, sort_keys=True)
+
+
+def source_state(path):
+    stat = os.stat(path)
+    return {'path': str(Path(path).resolve()), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def source_unchanged(source):
+    try:
+        state = source_state(source['path'])
+    except FileNotFoundError:
+        return False
+    if state['mtime_ns'] == source['mtime_ns'] and state['size'] == source['size']:
+        return True
+    # Touched but maybe not edited, so compare contents before giving up on it
+    return state['size'] == source['size'] and file_digest(source['path']) == source['digest']
+
+
+def compiled_entry(source_paths, reader):
+    # Manifest entry of the compiled form of source_paths[0] if none of the
+    # source files have changed since it was compiled, otherwise None
+    entry = load_manifest().get(entry_name(source_paths[0], reader))
+    if entry is None or not (STORE_DIR / entry['file']).exists():
+        return None
+    if [source['path'] for source in entry['sources']] != [str(Path(path).resolve()) for path in source_paths]:
+        return None
+    if not all(map(source_unchanged, entry['sources'])):
+        return None
+    return entry
+
+
+def open_compiled(entry, columns=None):
+    # Arrow table backed by a memory map of the compiled file, nothing is read until it's used
+    table = pa.ipc.open_file(pa.memory_map(str(STORE_DIR / entry['file']))).read_all()
+    return table if columns is None else table.select(list(columns))
+
+
+def read_compiled(entry, columns=None):
+    # split_blocks keeps each column in its own block, so numeric columns
+    # without missing values stay views of the memory map rather than copies
+    return open_compiled(entry, columns).to_pandas(split_blocks=True)
+
+
+def iter_compiled(entry, chunksize, columns=None):
+    table = open_compiled(entry, columns)
+    for offset in range(0, table.num_rows, chunksize):
+        yield table.slice(offset, chunksize).to_pandas(split_blocks=True)
+
+
+def write_compiled(source_paths, reader, df, **details):
+    # Writes df as the compiled form of source_paths[0], read with reader from
+    # source_paths. details are kept in the manifest entry for the reader
+    name = entry_name(source_paths[0], reader)
+    compiled_file = '{}.arrow'.format(hashlib.sha1(name.encode('utf-8')).hexdigest()[:20])
+    sources = [dict(source_state(path), digest=file_digest(path)) for path in source_paths]
+
+    with atomic_write(STORE_DIR / compiled_file) as temp_path:
+        # Memory mapping needs the file uncompressed
+        feather.write_feather(df.reset_index(drop=True), temp_path, compression='uncompressed')
+
+    entries = dict(load_manifest())
+    entries[name] = dict(details, reader=reader, file=compiled_file, sources=sources, rows=len(df))
+    save_manifest(entries)
+    return STORE_DIR / compiled_file
@@ -1,13 +1,25 @@
 import os
 import re
-import json
+import argparse
 from textwrap import wrap
 import base64
 import hashlib
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from frame_cache import cache_key, load_or_build
+from aurin_metadata import read_aurin_csv, metadata_path_for
+from correlation_engine import pearson_matrices, correlation_table
+from correlation_significance import correlation_significance
+from plot_render import plot_spec, render_plots
+from sa2_geography import to_5digit_index, join_on_sa2
+from census_schema import read_census_csv
+import instrumentation
+from instrumentation import instrumented
+from paths import SRC_DIR, DATASETS_DIR, OUTPUT_DIR, PLOTS_DIR
 
 
 
@@ -16,13 +28,48 @@ from pathlib import Path
 
 # TODO: Plot scatter graph of Income vs. Metric Outcomes
 
-def find_correlations_multiyear(years):
+# {cache key: long format AEDC data} so each process only loads it once
+_aedc_data = {}
+
+# Census years the LIHS metrics are ranked against median household income for
+LIHS_years = ['2011', '2016']
+
+# Yearly releases of the income measures correlated in the 'table' stage
+income_file_pattern = re.compile(r'Income-Including-Govt-Allowances-(\d{4})\.csv')
+
+# Source files of the code the cached frames below are built with, part of
+# their cache keys so that editing any of them rebuilds the frames
+correlation_code_files = [
+    SRC_DIR / filename for filename in [
+        'find_correlations.py', 'correlation_engine.py', 'correlation_significance.py',
+        'aurin_metadata.py', 'census_schema.py', 'sa2_geography.py',
+    ]
+]
+
+# 'correlations' ranks metrics against median household income,
+# 'significance' adds bootstrap CIs and permutation p-values to them, 'plots'
+# renders the highly correlated ones, 'table' correlates every income
+# measure of every income year
+STAGES = ['correlations', 'significance', 'plots', 'table']
+
+# {'LIHS (census) year':['AURIN csvs of its LIHS metrics']}
+aurin_LIHS_files = {
+    '2011':['Family-and-Community-2011.csv'],
+    '2016':['Family-and-Community-2016.csv']
+}
+
+@instrumented
+def find_correlations_multiyear(years, plot_specs=None, significance=False, incremental=False):
+    # With significance, each year also gets bootstrap CI and permutation p-value columns.
+    # With incremental, each year's columns are kept in the frame cache and only
+    # recomputed when one of that year's inputs or the code changes. Plot specs are
+    # made either way, and render_plots only redraws the ones that are missing or changed
     corrs_all = pd.DataFrame()
     for year in years:
-        data = get_LIHS_data(year) 
-        income = get_income_data(year)
-        corr = find_correlations(data, income, year)
-        corr = corr.rename("{} {}".format(corr.name, year))
+        if incremental:
+            corr = load_year_correlations(year, plot_specs, significance)
+        else:
+            corr = year_correlations(year, plot_specs, significance)
         if corrs_all.empty: 
             corrs_all = corr
         else: 
@@ -31,6 +78,44 @@ def find_correlations_multiyear(years):
     corrs_all.sort_values('Correlation Strength {}'.format(year))
     return corrs_all
 
+def year_correlations(year, plot_specs=None, significance=False, incremental=False):
+    data = load_LIHS_data(year) if incremental else get_LIHS_data(year)
+    income = get_income_data(year)
+    corr = find_correlations(data, income, year, plot_specs).to_frame()
+    if significance:
+        corr = corr.join(correlation_significance(
+            data.drop(columns=['Year'], errors='ignore'),
+            income['Weekly Household Income']
+        ))
+    corr.columns = ["{} {}".format(column, year) for column in corr.columns]
+    return corr
+
+def load_year_correlations(year, plot_specs=None, significance=False):
+    key = cache_key(
+        'correlations',
+        LIHS_input_files(year) + [DATASETS_DIR / 'income_{}.csv'.format(year)],
+        {'year': year, 'significance': significance},
+        correlation_code_files
+    )
+    # Specs made while building are dropped, a cache hit wouldn't make any
+    corr = load_or_build(key, lambda: year_correlations(year, [], significance, incremental=True))
+    if plot_specs is not None:
+        strengths = corr['Correlation Strength {}'.format(year)].rename('Correlation Strength')
+        plot_specs.extend(correlation_plot_specs(load_LIHS_data(year), get_income_data(year), strengths, year))
+    return corr
+
+def LIHS_input_files(year):
+    # Every file the LIHS metrics of a census year are read from
+    files = [DATASETS_DIR / filename for filename in aurin_LIHS_files[year]]
+    files += sorted((DATASETS_DIR / 'AEDC').glob('*.csv'))
+    return files + [Path(metadata_path_for(file)) for file in files]
+
+def load_LIHS_data(year):
+    # get_LIHS_data, kept in the frame cache until one of its inputs changes
+    key = cache_key('LIHS-data', LIHS_input_files(year), {'year': year}, correlation_code_files)
+    return load_or_build(key, lambda: get_LIHS_data(year))
+
+@instrumented
 def get_LIHS_data(year):
     # {'income year':'corresponding aedc year'}
     aedc_years = {
@@ -40,120 +125,207 @@ def get_LIHS_data(year):
     aedc_data = get_aedc_data_by_year(aedc_years[year])
     aurin_data = get_aurin_LIHS_data(year)
     # Change aurin_data from 9-digit SA2 Code to 5-digit
-    aurin_data.index = aurin_data.index.map(lambda x: int(str(x)[0] + str(x)[-4:]))
-    all_data = pd.merge(aedc_data, aurin_data, on='SA2 Code')
+    aurin_data.index = to_5digit_index(aurin_data.index)
+    all_data = join_on_sa2(aedc_data, aurin_data)
     return all_data
 
+@instrumented
 def get_aurin_LIHS_data(year):
-    aurin_LIHS_files = {
-        '2011':['Family-and-Community-2011.csv'],
-        '2016':['Family-and-Community-2016.csv']
-        }
     data = pd.DataFrame()
     for csv_filename in aurin_LIHS_files[year]:
         temp_LIHS_df = get_LIHS_from_csv(csv_filename) # Retrieve LIHS dataframe
         if data.empty:
             data = temp_LIHS_df
         else:
-            data = pd.merge(data, temp_LIHS_df, on='SA2 Code') # Merge all
+            data = join_on_sa2(data, temp_LIHS_df) # Merge all
     return data
 
-def get_LIHS_from_csv(filename):
-    data_path = '../Datasets/' + filename                  # csv filepath
-    metadata_path = data_path[0:-4] + '-metadata.json'  # json filepath
-    df = pd.read_csv(data_path)                     # read csv
-    file = open(metadata_path)                      # read json
-    metadata = json.load(file)                      # load json
-    for heading in df.columns:                      # for each column
-        heading_nospace = heading.replace(" ", "")  # Remove whitespace
-        for D in metadata['selectedAttributes']:    # In each dictionary...
-            if heading_nospace == D['name']:        # If 'ugly name' match found
-                df.rename({heading:D['title']}, axis=1, inplace=True)
-                break
+@instrumented
+def get_LIHS_from_csv(filename, columns=None):
+    data_path = DATASETS_DIR / filename                  # csv filepath
+    # read csv with the metadata titles as headings, only parsing the
+    # requested columns (by name or title) if given. The SA2 code the index is
+    # built on is always parsed, since it isn't always the metadata key column
+    if columns is not None:
+        columns = list(columns) + ['SA2 Code (ASGS 2016).', 'SA2 Code']
+    df = read_aurin_csv(data_path, columns=columns)
     # Manual heading and type cleanup
     df.rename({'SA2 Code (ASGS 2016).':'SA2 Code'}, axis=1, inplace=True)
     df['SA2 Code'] = df['SA2 Code'].astype(int)
     df.set_index('SA2 Code', inplace=True)
     return df
 
-def find_correlations(data, income, year):
-    corrs = data.corrwith( 
-        income.loc[:,'Weekly Household Income'], # Series
-        method='pearson')
+@instrumented
+def find_correlations(data, income, year, plot_specs=None):
+    # Plots are added to plot_specs for rendering later if given, otherwise rendered straight away
+    pearson_df, _ = pearson_matrices(
+        data,
+        income.loc[:, ['Weekly Household Income']]
+    )
+    corrs = pearson_df['Weekly Household Income']
     corrs.index.rename(name='LIHS Metric', inplace=True)
     corrs = corrs.sort_values(ascending=False)
     corrs = corrs.rename('Correlation Strength', inplace=True)
     pd.Series.drop(corrs, ['Year'], inplace=True)   # Drop rows (Series only)
 
-    # Determine which metrics to plot, then plot them.
+    specs = correlation_plot_specs(data, income, corrs, year)
+    if plot_specs is None:
+        render_plots(specs)
+    else:
+        plot_specs.extend(specs)
+
+    return corrs
+
+def correlation_plot_specs(data, income, corrs, year):
+    # Plot specs of the metrics strongly correlated with income
     metrics_to_plot = data[corrs[corrs.abs() > 0.4].index]
-    # merge with income to align them for plotting. probs a better way to do this.
-    income_aligned = metrics_to_plot.merge(income, on='SA2 Code')['Weekly Household Income']
+    # join with income to align them for plotting
+    aligned = join_on_sa2(metrics_to_plot, income.loc[:, ['Weekly Household Income']])
+    income_aligned = aligned['Weekly Household Income']
     # plot each metric
-    for metric in metrics_to_plot:
+    return [
         plot_metric_against_income(
-            metrics_to_plot[metric],
+            aligned[metric],
             income_aligned,
             corrs[metric],
             year
         )
+        for metric in metrics_to_plot
+    ]
 
-    return corrs
-
+@instrumented
 def get_income_data(year):
-    data = pd.read_csv('../Datasets/income_{}.csv'.format(year),
-                        dtype=str, na_values='null')
-    data.columns = data.columns.str.strip() # Clean heading names
-    
-    # Remove irrelevant cols. 
-    data = data.loc[:,[
-        'sa2_maincode_2016',
-        'equivalised_total_household_income_census_median_weekly'
-        ]
-    ]
-    
+    # Only the SA2 code and median income columns are parsed, see census_schema.py
+    data = read_census_csv('income', year=year)
+
     # Rename relevant cols.
     data.columns = ['SA2 Code', 'Weekly Household Income']
-    
-    # convert type. should be int, but there are some null values so we use float
-    data = data.astype({
-        'Weekly Household Income': float,
-        'SA2 Code': int
-        })
     data.set_index('SA2 Code', inplace=True)
-    data.index = data.index.map(lambda x: int(str(x)[0] + str(x)[-4:]))
+    data.index = to_5digit_index(data.index)
     return data
 
-def write_final_output_to_csv(data):
-    output_folder = Path('../OutputCSV/')
-    output_folder.mkdir(parents=True, exist_ok=True) # Make output folder  
+@instrumented
+def get_income_measures(year):
+    # Every income measure from the ABS income series for that year
+    data = get_LIHS_from_csv('Income-Including-Govt-Allowances-{}.csv'.format(year))
+    data = data.drop(columns='Year').select_dtypes('number')
+    data.index = to_5digit_index(data.index)
+    return data
+
+@instrumented
+def find_income_years(datasets_dir=DATASETS_DIR):
+    # Years of every income release in Datasets/, so a new release is picked up without code changes
+    paths = datasets_dir.glob('Income-Including-Govt-Allowances-*.csv')
+    matches = (income_file_pattern.fullmatch(path.name) for path in paths)
+    return sorted(match.group(1) for match in matches if match)
+
+def LIHS_year_for(income_year):
+    # The LIHS (census) year an income year's measures are correlated against:
+    # the nearest census year, the earlier one on a tie
+    return min(LIHS_years, key=lambda LIHS_year: (abs(int(LIHS_year) - int(income_year)), LIHS_year))
+
+def find_correlation_table(income_years, incremental=False):
+    # Correlate every income measure of every income year against every LIHS
+    # metric of the census year it is paired with. With incremental, each income
+    # year's rows are kept in the frame cache, so a new release only costs its own year
+    LIHS_data = {}
+    def get_year_LIHS_data(LIHS_year):
+        if LIHS_year not in LIHS_data:
+            load = load_LIHS_data if incremental else get_LIHS_data
+            LIHS_data[LIHS_year] = load(LIHS_year).drop(columns='Year')
+        return LIHS_data[LIHS_year]
+
+    tables = []
+    for year in income_years:
+        LIHS_year = LIHS_year_for(year)
+        build = lambda: income_year_correlation_table(get_year_LIHS_data(LIHS_year), year, LIHS_year)
+        if incremental:
+            income_path = DATASETS_DIR / 'Income-Including-Govt-Allowances-{}.csv'.format(year)
+            key = cache_key(
+                'correlation-table',
+                LIHS_input_files(LIHS_year) + [income_path, Path(metadata_path_for(income_path))],
+                {'year': year, 'LIHS year': LIHS_year},
+                correlation_code_files
+            )
+            tables.append(load_or_build(key, build))
+        else:
+            tables.append(build())
+    return merge_correlation_tables(tables)
+
+def income_year_correlation_table(data, year, LIHS_year):
+    income = pd.concat({year: get_income_measures(year)}, axis=1, names=['Income Year', 'Income Measure'])
+    table = correlation_table(data, income)
+    table.insert(0, 'LIHS Year', LIHS_year)
+    return table
+
+def merge_correlation_tables(tables):
+    # Rows grouped by LIHS year, then metric, then income year and measure
+    table = pd.concat(tables, ignore_index=True)
+    metric_order = table.groupby(['LIHS Year', 'LIHS Metric'], sort=False).ngroup().to_numpy()
+    order = np.lexsort((metric_order, table['LIHS Year'].to_numpy()))
+    return table.iloc[order].reset_index(drop=True)
+
+def correlations_csv(years):
+    return OUTPUT_DIR / 'Income-LIHS Correlations ({}).csv'.format(', '.join(years))
+
+def correlation_table_csv():
+    # Not named by its years, which come from the files in Datasets/, so
+    # pipeline.py can declare it as an output. They're in the 'Income Year' column
+    return OUTPUT_DIR / 'Income-LIHS Correlation Table.csv'
+
+@instrumented
+def write_correlation_table_to_csv(table):
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True) # Make output folder
+    table.to_csv(
+        correlation_table_csv(),
+        index=False
+        )
+
+@instrumented
+def write_final_output_to_csv(data, years):
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True) # Make output folder  
     data.to_csv(
-        '../OutputCSV/Income-LIHS Correlations ({}).csv'.format(', '.join(years))
+        correlations_csv(years)
         )
 
+@instrumented
+def get_aedc_domain_data(file):
+    domain_name = file.stem.replace('_', ' ')
+    raw_df = get_LIHS_from_csv(str(file.relative_to(DATASETS_DIR)))
+    # raw_df = raw_df.set_index('SA2 Code')
+    # get a df of just the percentage data
+    df_cols = list(filter(lambda x: '(%)' in x, raw_df.columns.values))
+    df = raw_df[df_cols]
+    # extract years from col names
+    df.columns = df.columns.map(lambda x: (' '.join(x.split()[:-1]), x.split()[-1]))
+    # stack records
+    df = df.stack([0, 1]).reset_index()
+    df.columns = ['SA2 Main Code', 'Status', 'Year', 'Percentage']
+    # add on domain type
+    df['Domain'] = 'AEDC - ' + domain_name
+    return df
+
+@instrumented
 def get_aedc_data():
-    files = Path('../Datasets/AEDC').glob('*.csv')
-    data = []
-    for file in files:
-        domain_name = file.stem.replace('_', ' ')
-        raw_df = get_LIHS_from_csv(str(file.relative_to('../Datasets')))
-        # raw_df = raw_df.set_index('SA2 Code')
-        # get a df of just the percentage data
-        df_cols = list(filter(lambda x: '(%)' in x, raw_df.columns.values))
-        df = raw_df[df_cols]
-        # extract years from col names
-        df.columns = df.columns.map(lambda x: (' '.join(x.split()[:-1]), x.split()[-1]))
-        # stack records
-        df = df.stack([0, 1]).reset_index()
-        df.columns = ['SA2 Main Code', 'Status', 'Year', 'Percentage']
-        # add on domain type
-        df['Domain'] = 'AEDC - ' + domain_name
-        # save the df
-        data.append(df)
-
-    data = pd.concat(data)
+    files = sorted((DATASETS_DIR / 'AEDC').glob('*.csv'))
+    # Key on the csv and metadata modification times, so the long table is only
+    # rebuilt when one of the domain files changes
+    sources = files + [Path(metadata_path_for(file)) for file in files]
+    key = cache_key('aedc', params={
+        'sources': [(source.name, source.stat().st_mtime_ns) for source in sources]
+    }, code_paths=correlation_code_files)
+    if key not in _aedc_data:
+        _aedc_data[key] = load_or_build(key, lambda: load_aedc_data(files))
+    return _aedc_data[key]
+
+def load_aedc_data(files):
+    # Parse the domain files concurrently, then stack them once
+    with ThreadPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as executor:
+        data = list(executor.map(get_aedc_domain_data, files))
+    data = pd.concat(data, ignore_index=True)
     return data
 
+@instrumented
 def get_aedc_data_by_year(year):
     data = get_aedc_data()
     data = data[data['Year'] == year]
@@ -164,19 +336,38 @@ def get_aedc_data_by_year(year):
     return data
 
 def plot_metric_against_income(metric, income, strength, year):
-    plt.clf()
-    plt.scatter(income, metric, color='green', s=5)
-    plt.xscale('linear')
-    plt.yscale('linear')
-    #plt.tick_params(bottom=False, labelbottom=False)
-    plt.xlabel('Weekly Household Income ($AUD)')
-    plt.ylabel('Measured Metric ' + metric.name.split()[-1])
-    plt.title('\n'.join(wrap('Income Versus {} ({})'.format(metric.name, year), 60)))
+    # Returns the spec of the scatter plot, see plot_render.render_plots
+    return plot_spec(
+        PLOTS_DIR / 'Corrs' / '{}_{}_{}.png'.format(
+            create_friendly_filename(metric.name),
+            year,
+            # collision prevention
+            base64.urlsafe_b64encode(
+                hashlib.sha1(metric.name.encode('utf-8')).digest()
+            )[:5].decode()
+        ),
+        draw_metric_against_income,
+        metric_name=metric.name,
+        metric_values=metric.to_numpy(),
+        income_values=income.to_numpy(),
+        strength=strength,
+        year=year
+    )
+
+def draw_metric_against_income(fig, metric_name, metric_values, income_values, strength, year):
+    ax = fig.add_subplot()
+    ax.scatter(income_values, metric_values, color='green', s=5)
+    ax.set_xscale('linear')
+    ax.set_yscale('linear')
+    #ax.tick_params(bottom=False, labelbottom=False)
+    ax.set_xlabel('Weekly Household Income ($AUD)')
+    ax.set_ylabel('Measured Metric ' + metric_name.split()[-1])
+    ax.set_title('\n'.join(wrap('Income Versus {} ({})'.format(metric_name, year), 60)))
     # put in corr strength
-    plt.text(
+    ax.text(
         0.95, 0.05,
         'Correlation Strength: {:.4f}'.format(strength),
-        transform=plt.gca().transAxes,
+        transform=ax.transAxes,
         ha='right',
         bbox={
             'boxstyle': 'round',
@@ -185,24 +376,51 @@ def plot_metric_against_income(metric, income, strength, year):
         }
     )
 
-    plt.tight_layout()
-    #plt.grid(True)
-    output_folder = Path('../Plots/Corrs')
-    output_folder.mkdir(parents=True, exist_ok=True)
-    plt.savefig(fname=Path('../Plots/Corrs/{}_{}_{}.png'.format(
-        create_friendly_filename(metric.name),
-        year,
-        # collision prevention
-        base64.urlsafe_b64encode(
-            hashlib.sha1(metric.name.encode('utf-8')).digest()
-        )[:5].decode()
-    )))
+    fig.tight_layout()
+    #ax.grid(True)
 
 def create_friendly_filename(metric_name):
     return re.sub(r'[^\w-]', '-', metric_name)[:30]
 
+def selected_stages(stages):
+    # 'significance' only adds columns to the correlations, so asking for it on its own means both
+    stages = set(stages)
+    if 'significance' in stages:
+        stages.add('correlations')
+    return stages
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Find correlations between income and LIHS metrics by SA2'
+    )
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=STAGES,
+        default=STAGES,
+        help="Stages to run (default: all), 'significance' also runs 'correlations'"
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Reuse cached per-year results, only recomputing years whose inputs changed'
+    )
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.enable_from_arguments(args)
+    args.stages = selected_stages(args.stages)
+
+    plot_specs = []
+    if 'correlations' in args.stages or 'plots' in args.stages:
+        df = find_correlations_multiyear(LIHS_years, plot_specs, 'significance' in args.stages, args.incremental)
+    if 'correlations' in args.stages:
+        write_final_output_to_csv(df, LIHS_years)
+    if 'plots' in args.stages:
+        # Rendered after the results are written so they aren't held up by plotting
+        render_plots(plot_specs)
+    if 'table' in args.stages:
+        table = find_correlation_table(find_income_years(), args.incremental)
+        write_correlation_table_to_csv(table)
+
 if __name__ == '__main__':
-    os.chdir(Path(__file__).parent) # Set working directory to script location
-    years = ['2011', '2016']
-    df = find_correlations_multiyear(years)
-    write_final_output_to_csv(df)
\ No newline at end of file
+    main()
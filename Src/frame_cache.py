@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+import pandas as pd
+
+import paths
+from instrumentation import instrumented
+
+
+## Content addressed cache for derived dataframes.
+## A cache key is a hash of the stage name, the bytes of its input files, any
+## parameters (including the keys of upstream stages) and the source files of
+## the code that builds it (where given), so a stage is only rebuilt when
+## something it depends on has actually changed. Entries are stored as parquet
+## and the least recently used ones are evicted once the cache grows past its
+## size budget.
+
+CACHE_DIR = paths.CACHE_DIR / 'frames'
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+# Bump this if a code change not covered by the keys' code_paths should invalidate every cached entry
+CACHE_VERSION = 2
+
+# {(path, mtime, size): digest} so unchanged files are only hashed once per process
+_file_digests = {}
+
+
+@contextmanager
+def atomic_write(path):
+    # Yields a temp path next to path to write to, which replaces path once the
+    # block finishes, so other processes never read a half written file. The
+    # temp file is removed if the block raises
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    memo_key = (str(Path(path).resolve()), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _file_digests:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[memo_key] = digest.hexdigest()
+    return _file_digests[memo_key]
+
+
+def cache_key(stage, input_paths=(), params=None, code_paths=()):
+    description = {
+        'stage': stage,
+        'version': CACHE_VERSION,
+        'inputs': [file_digest(path) for path in input_paths],
+        'params': params or {},
+        'code': [file_digest(path) for path in code_paths],
+    }
+    encoded = json.dumps(description, sort_keys=True, default=str).encode('utf-8')
+    return '{}-{}'.format(stage, hashlib.sha1(encoded).hexdigest()[:20])
+
+
+@instrumented
+def load_or_build(key, build, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    cache_path = Path(cache_dir) / '{}.parquet'.format(key)
+    if cache_path.exists():
+        # Touch the entry so eviction treats it as recently used
+        os.utime(cache_path)
+        return pd.read_parquet(cache_path)
+
+    df = build()
+    with atomic_write(cache_path) as temp_path:
+        df.to_parquet(temp_path)
+    evict_old_entries(cache_dir, max_bytes)
+    return df
+
+
+def evict_old_entries(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    entries = []
+    for path in Path(cache_dir).glob('*.parquet'):
+        stat = path.stat()
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total_bytes = sum(size for _, size, _ in entries)
+    # Oldest first
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total_bytes -= size
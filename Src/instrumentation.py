@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import resource
+import functools
+import threading
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import paths
+
+
+## Stage level instrumentation. Functions marked @instrumented record their
+## wall and CPU time, the process's peak RSS and the rows going in and out,
+## and each run writes a json report of every stage call. Turned on with
+## --instrument on the scripts or LIHS_INSTRUMENT=1 (or a directory to write
+## the report to), plus --profile or LIHS_PROFILE=1 for a cProfile dump of each
+## outermost stage call, and --trace-memory or LIHS_TRACE_MEMORY=1 for the peak
+## memory traced by tracemalloc. Tracing every allocation slows the run down, so
+## it's off unless asked for and the report records whether the timings include
+## it. When instrumentation is off, a stage call is a single flag check on top
+## of the function itself. Stages can also run on worker threads (e.g. the AEDC
+## domains), but tracemalloc's peak and cProfile are per process, so memory
+## peaks and profiles are only taken on the main thread. Peaks need
+## tracemalloc.reset_peak (Python 3.9+) and are left out without it.
+
+INSTRUMENT_ENV_VAR = 'LIHS_INSTRUMENT'
+PROFILE_ENV_VAR = 'LIHS_PROFILE'
+TRACE_MEMORY_ENV_VAR = 'LIHS_TRACE_MEMORY'
+REPORT_DIR = paths.CACHE_DIR / 'run-reports'
+
+_run = {
+    'enabled': False,
+    'profile': False,
+    'trace_memory': False,
+    'report_dir': REPORT_DIR,
+    'run_id': None,
+    'records': [],
+    'profiling': False,
+}
+
+# Stages running on each thread, with the peak traced memory of each on the main thread, innermost last
+_stacks = threading.local()
+
+
+def instrumentation_enabled():
+    return _run['enabled']
+
+
+def enable_instrumentation(profile=False, report_dir=None, trace_memory=False):
+    if not _run['enabled']:
+        _run['enabled'] = True
+        _run['run_id'] = '{}-{}'.format(
+            Path(sys.argv[0]).stem or 'python', datetime.now().strftime('%Y%m%d-%H%M%S')
+        )
+        atexit.register(write_report)
+    if trace_memory and not _run['trace_memory']:
+        _run['trace_memory'] = True
+        tracemalloc.start()
+    _run['profile'] = _run['profile'] or profile
+    if report_dir is not None:
+        _run['report_dir'] = Path(report_dir)
+
+
+def enable_from_environment():
+    instrument = os.environ.get(INSTRUMENT_ENV_VAR, '')
+    profile = os.environ.get(PROFILE_ENV_VAR, '') not in ('', '0')
+    trace_memory = os.environ.get(TRACE_MEMORY_ENV_VAR, '') not in ('', '0')
+    if instrument not in ('', '0') or profile or trace_memory:
+        enable_instrumentation(
+            profile, report_dir=None if instrument in ('', '0', '1') else instrument, trace_memory=trace_memory
+        )
+
+
+def count_rows(value):
+    # Rows in a frame or series, summed over lists, tuples and dict values of them. None if there aren't any
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        counts = [count for count in map(count_rows, value) if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def add_arguments(parser):
+    # The --instrument, --profile and --trace-memory options of the scripts, see enable_from_arguments
+    parser.add_argument(
+        '--instrument',
+        action='store_true',
+        help='Write a json report of the time, memory and rows of each stage (see instrumentation.py)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Also write a cProfile dump of each stage'
+    )
+    parser.add_argument(
+        '--trace-memory',
+        action='store_true',
+        help='Also record the peak memory traced by tracemalloc in each stage, which slows the run down'
+    )
+
+
+def enable_from_arguments(args):
+    if args.instrument or args.profile or args.trace_memory:
+        enable_instrumentation(args.profile, trace_memory=args.trace_memory)
+
+
+def instrumented(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _run['enabled']:
+            return function(*args, **kwargs)
+        return run_stage(function, args, kwargs)
+    return wrapper
+
+
+def run_stage(function, args, kwargs):
+    # Nested stages share tracemalloc's single peak, so each stage restarts it
+    # and hands its own peak up to the stage it was called from
+    on_main_thread = threading.current_thread() is threading.main_thread()
+    track_peaks = _run['trace_memory'] and on_main_thread and hasattr(tracemalloc, 'reset_peak')
+    if not hasattr(_stacks, 'peaks'):
+        _stacks.peaks = []
+    peaks = _stacks.peaks
+    current_bytes = None
+    if track_peaks:
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        if peaks:
+            peaks[-1] = max(peaks[-1], peak_bytes)
+        tracemalloc.reset_peak()
+    peaks.append(current_bytes)
+
+    profiler = None
+    if _run['profile'] and on_main_thread and not _run['profiling']:
+        profiler = cProfile.Profile()
+        _run['profiling'] = True
+        profiler.enable()
+
+    # CPU time of the whole process on the main thread, which includes any
+    # workers it's waiting on, and of just the worker otherwise
+    cpu_time = time.process_time if on_main_thread else time.thread_time
+    start_wall = time.perf_counter()
+    start_cpu = cpu_time()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        wall_seconds = time.perf_counter() - start_wall
+        cpu_seconds = cpu_time() - start_cpu
+        if profiler is not None:
+            profiler.disable()
+            _run['profiling'] = False
+
+        stage_peak_bytes = peaks.pop()
+        if track_peaks:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            stage_peak_bytes = max(stage_peak_bytes, peak_bytes)
+            if peaks:
+                peaks[-1] = max(peaks[-1], stage_peak_bytes)
+            tracemalloc.reset_peak()
+
+    record = {
+        'stage': '{}.{}'.format(function.__module__, function.__qualname__),
+        'thread': threading.current_thread().name,
+        'depth': len(peaks),
+        'started': start_wall,
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': cpu_seconds,
+        # Peak of memory allocated while the stage ran, above what was allocated when it started
+        'peak_traced_mb': (stage_peak_bytes - current_bytes) / 2**20 if track_peaks else None,
+        # ru_maxrss is in kilobytes on Linux
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'rows_in': count_rows(list(args) + list(kwargs.values())),
+        'rows_out': count_rows(result),
+    }
+    if profiler is not None:
+        profile_path = _run['report_dir'] / '{}-{}-{}.prof'.format(
+            _run['run_id'], function.__qualname__, len(_run['records'])
+        )
+        profile_path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(profile_path)
+        record['profile'] = str(profile_path)
+    _run['records'].append(record)
+    return result
+
+
+def summarise_records(records):
+    # Totals per stage, slowest first
+    if not records:
+        return []
+    records_df = pd.DataFrame(records)
+    summary_df = records_df.groupby('stage').agg(
+        calls=('wall_seconds', 'size'),
+        wall_seconds=('wall_seconds', 'sum'),
+        cpu_seconds=('cpu_seconds', 'sum'),
+        peak_traced_mb=('peak_traced_mb', 'max'),
+        max_rss_mb=('max_rss_mb', 'max'),
+    ).sort_values('wall_seconds', ascending=False)
+    return summary_df.reset_index().to_dict('records')
+
+
+def write_report(path=None):
+    if not _run['records']:
+        return None
+    if path is None:
+        path = _run['report_dir'] / '{}.json'.format(_run['run_id'])
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    first_started = min(record['started'] for record in _run['records'])
+    report = {
+        'run_id': _run['run_id'],
+        'argv': sys.argv,
+        'finished': datetime.now(timezone.utc).isoformat(),
+        # Whether tracemalloc ran, and so whether the timings include its overhead
+        'trace_memory': _run['trace_memory'],
+        'summary': summarise_records(_run['records']),
+        # Calls in the order they finished, 'started' is relative to the first
+        'calls': [
+            dict(record, started=record['started'] - first_started)
+            for record in _run['records']
+        ],
+    }
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=1)
+    print('Instrumentation report written to {}'.format(path), file=sys.stderr)
+    return path
+
+
+enable_from_environment()
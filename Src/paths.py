@@ -0,0 +1,19 @@
+import os
+from pathlib import Path
+
+
+## Locations of the project's data, resolved from this file rather than the
+## working directory so the modules can be imported and run from anywhere.
+## The data folders live under ROOT_DIR unless LIHS_DATA_ROOT points to
+## another folder with the same layout (Datasets/, OutputCSV/, Plots/).
+
+DATA_ROOT_ENV_VAR = 'LIHS_DATA_ROOT'
+
+SRC_DIR = Path(__file__).resolve().parent
+ROOT_DIR = SRC_DIR.parent
+DATA_ROOT = Path(os.environ.get(DATA_ROOT_ENV_VAR) or ROOT_DIR).resolve()
+DATASETS_DIR = DATA_ROOT / 'Datasets'
+OUTPUT_DIR = DATA_ROOT / 'OutputCSV'
+PLOTS_DIR = DATA_ROOT / 'Plots'
+# Caches are derived from the data, so they sit with it
+CACHE_DIR = DATA_ROOT / '.cache'
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import paths
+from frame_cache import atomic_write, cache_key, file_digest
+from find_correlations import LIHS_years, correlations_csv
+from rent_proportion_analysis import plotted_years, cost_of_living_plot_png
+
+
+## Refreshes every output with one command. Each stage is one of the scripts
+## run with some of its --stages, declared with the files it reads and writes
+## (relative to the data root, see paths.py). A stage depends on the stages
+## that write its inputs, and runs in its own process as soon as they're done,
+## so independent branches like the rent processing and the correlations run
+## at the same time. A stage is skipped when its inputs, its command, the code
+## in Src/ and its outputs are all the same as after it last ran.
+## python pipeline.py [--stages correlations ...] [--force] [--jobs 2] [--data-root ../other-data]
+
+
+def data_root_relative(path):
+    # Output paths of the scripts, relative to the data root they were resolved against
+    return path.relative_to(paths.DATA_ROOT).as_posix()
+
+
+# {stage: (script and arguments, input globs, output files)}, paths relative to the data root
+PIPELINE_STAGES = {
+    'cost-of-living': (
+        ['rent_proportion_processor.py'],
+        [
+            'Datasets/Dwelling-Structure-And-Number-Of-Bedrooms-By-SA2-2006-2011-2016.csv',
+            'Datasets/Rent-Weekly-By-SA2-Melbourne-2006-2011-2016.csv',
+        ],
+        ['OutputCSV/Cost-of-Living-By-SA2-Year-2006-2011-2016.csv'],
+    ),
+    'national-cost-of-living': (
+        ['rent_proportion_processor.py', '--partitioned'],
+        [
+            'Datasets/Dwelling-Structure-And-Number-Of-Bedrooms-By-SA2-*2006-2011-2016.csv',
+            'Datasets/Rent-Weekly-By-SA2-*2006-2011-2016.csv',
+            # Regions are matched to SA2 codes and states with the crosswalk, see sa2_geography.py
+            'Datasets/Income-Including-Govt-Allowances-*.csv',
+            'Datasets/AEDC/*.csv',
+            'Datasets/SA2_Estimating_Homelessness_2016.csv',
+        ],
+        ['OutputCSV/National-Cost-of-Living-By-SA2-Year-2006-2011-2016.csv'],
+    ),
+    'predict-cost-of-living': (
+        ['rent_proportion_analysis.py', '--stages', 'predict'],
+        ['OutputCSV/Cost-of-Living-By-SA2-Year-2006-2011-2016.csv', 'Datasets/CPI-Housing-Since-2016.csv'],
+        ['OutputCSV/Predicted-Cost-of-Living-By-SA2-Year.csv'],
+    ),
+    'cost-of-living-plots': (
+        ['rent_proportion_analysis.py', '--stages', 'plot'],
+        ['OutputCSV/Predicted-Cost-of-Living-By-SA2-Year.csv'],
+        [data_root_relative(cost_of_living_plot_png(year)) for year in plotted_years()],
+    ),
+    'correlations': (
+        ['find_correlations.py', '--stages', 'correlations', 'significance', 'plots', '--incremental'],
+        [
+            'Datasets/Family-and-Community-*.csv',
+            'Datasets/Family-and-Community-*-metadata.json',
+            'Datasets/AEDC/*.csv',
+            'Datasets/AEDC/*-metadata.json',
+            'Datasets/income_*.csv',
+        ],
+        [data_root_relative(correlations_csv(LIHS_years))],
+    ),
+    'correlation-table': (
+        ['find_correlations.py', '--stages', 'table', '--incremental'],
+        [
+            'Datasets/Family-and-Community-*.csv',
+            'Datasets/Family-and-Community-*-metadata.json',
+            'Datasets/AEDC/*.csv',
+            'Datasets/AEDC/*-metadata.json',
+            'Datasets/Income-Including-Govt-Allowances-*.csv',
+            'Datasets/Income-Including-Govt-Allowances-*-metadata.json',
+        ],
+        ['OutputCSV/Income-LIHS Correlation Table.csv'],
+    ),
+}
+
+
+def stage_dependencies(stages):
+    # {stage: stages writing one of its inputs}, only among the given stages
+    writers = {output: stage for stage in stages for output in PIPELINE_STAGES[stage][2]}
+    return {
+        stage: sorted({writers[pattern] for pattern in PIPELINE_STAGES[stage][1] if pattern in writers} - {stage})
+        for stage in stages
+    }
+
+
+def stage_inputs(stage, data_root):
+    # The input files of a stage that exist right now, in a stable order
+    return [
+        path
+        for pattern in PIPELINE_STAGES[stage][1]
+        for path in sorted(Path(data_root).glob(pattern))
+    ]
+
+
+def stage_key(stage, data_root):
+    # Changes whenever an input, the stage's command or any of the code changes
+    command = PIPELINE_STAGES[stage][0]
+    code_files = sorted(paths.SRC_DIR.glob('*.py'))
+    return cache_key('pipeline-{}'.format(stage), code_files + stage_inputs(stage, data_root), {'command': command})
+
+
+def output_digests(stage, data_root):
+    # {output: digest}, or None if one of the outputs is missing
+    outputs = [Path(data_root) / output for output in PIPELINE_STAGES[stage][2]]
+    if not all(output.exists() for output in outputs):
+        return None
+    return {str(output): file_digest(output) for output in outputs}
+
+
+def load_stamps(stamps_path):
+    try:
+        with open(stamps_path) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_stamps(stamps, stamps_path):
+    with atomic_write(stamps_path) as temp_path, open(temp_path, 'w') as file:
+        json.dump(stamps, file, indent=1, sort_keys=True)
+
+
+def run_stage(stage, data_root):
+    # Runs the stage's script in a new process, returns (return code, seconds, stderr)
+    command = PIPELINE_STAGES[stage][0]
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, str(paths.SRC_DIR / command[0])] + command[1:],
+        cwd=paths.SRC_DIR, capture_output=True, text=True,
+        env=dict(os.environ, **{paths.DATA_ROOT_ENV_VAR: str(data_root)})
+    )
+    return completed.returncode, time.perf_counter() - start, completed.stderr
+
+
+def run_pipeline(stages=None, data_root=paths.DATA_ROOT, force=False, max_workers=None, report=print):
+    # Runs stages (default: all) in dependency order, returns {stage: 'ran', 'skipped', 'failed' or 'blocked'}
+    stages = list(PIPELINE_STAGES) if stages is None else list(stages)
+    data_root = Path(data_root).resolve()
+    stamps_path = data_root / '.cache' / 'pipeline-stamps.json'
+    stamps = load_stamps(stamps_path)
+    dependencies = stage_dependencies(stages)
+    results = {}
+    running = {}
+
+    def ready_stages():
+        return [
+            stage for stage in stages
+            if stage not in results and stage not in running.values()
+            and all(dependency in results for dependency in dependencies[stage])
+        ]
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages)) as executor:
+        while len(results) < len(stages):
+            for stage in ready_stages():
+                if any(results[dependency] in ('failed', 'blocked') for dependency in dependencies[stage]):
+                    results[stage] = 'blocked'
+                    report('{:<8} {}'.format('blocked', stage))
+                    continue
+                # Keyed only once upstream stages are done, so it sees the inputs they wrote
+                stamp = stamps.get(stage, {})
+                if (not force and stamp.get('key') == stage_key(stage, data_root)
+                        and stamp.get('outputs') == output_digests(stage, data_root)):
+                    results[stage] = 'skipped'
+                    report('{:<8} {}'.format('skipped', stage))
+                    continue
+                running[executor.submit(run_stage, stage, data_root)] = stage
+            if not running:
+                if len(results) < len(stages) and not ready_stages():
+                    raise ValueError('Stages {} depend on each other'.format(sorted(set(stages) - set(results))))
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                return_code, seconds, stderr = future.result()
+                if return_code == 0:
+                    results[stage] = 'ran'
+                    stamps[stage] = {
+                        'key': stage_key(stage, data_root),
+                        'outputs': output_digests(stage, data_root),
+                    }
+                    save_stamps(stamps, stamps_path)
+                    report('{:<8} {} ({:.1f}s)'.format('ran', stage, seconds))
+                else:
+                    results[stage] = 'failed'
+                    report('{:<8} {} ({:.1f}s)\n{}'.format('failed', stage, seconds, stderr.rstrip()))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Refresh every output, running stages in parallel where the dependencies allow'
+    )
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=list(PIPELINE_STAGES),
+        default=list(PIPELINE_STAGES),
+        help='Stages to run (default: all). Inputs written by stages left out are used as they are'
+    )
+    parser.add_argument('--force', action='store_true', help="Run stages even if they're up to date")
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Stages to run at the same time (default: as many as are ready)'
+    )
+    parser.add_argument(
+        '--data-root',
+        type=Path,
+        default=paths.DATA_ROOT,
+        help='Folder holding Datasets/, OutputCSV/ and Plots/ (default: ${} or the repository)'.format(
+            paths.DATA_ROOT_ENV_VAR
+        )
+    )
+    args = parser.parse_args(argv)
+
+    results = run_pipeline(args.stages, args.data_root, args.force, args.jobs)
+    if any(result in ('failed', 'blocked') for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import os
+import json
+import pickle
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import paths
+from instrumentation import instrumented
+from frame_cache import atomic_write
+
+
+## Rendering of plots, kept separate from the analysis that decides what to plot.
+## The analysis emits plot specs: {'path': png path, 'draw': module level
+## function, 'args': dict of plain data}. render_plots draws each spec onto its
+## own Agg figure in a process pool, skipping any png whose spec hasn't changed
+## since it was last rendered.
+
+RENDER_MANIFEST = paths.CACHE_DIR / 'plot-hashes.json'
+
+# Bump this if a change to the drawing code should re-render every plot
+RENDER_VERSION = 1
+
+
+def plot_spec(path, draw, **args):
+    return {'path': str(Path(path).resolve()), 'draw': draw, 'args': args}
+
+
+def spec_hash(spec):
+    # The draw function is named by its source file rather than its module, which
+    # is '__main__' when its script is run directly and something else when imported
+    draw = spec['draw']
+    description = (RENDER_VERSION, Path(draw.__code__.co_filename).name, draw.__qualname__, spec['args'])
+    return hashlib.sha1(pickle.dumps(description)).hexdigest()
+
+
+def render_plot(spec):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    spec['draw'](fig, **spec['args'])
+    Path(spec['path']).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(spec['path'])
+    return spec['path']
+
+
+def load_manifest(manifest_path=RENDER_MANIFEST):
+    try:
+        with open(manifest_path) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest, manifest_path=RENDER_MANIFEST):
+    # A temp file per writer, since scripts run by pipeline.py can render at the same time
+    with atomic_write(manifest_path) as temp_path, open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+
+
+@instrumented
+def render_plots(specs, max_workers=None, force=False, manifest_path=RENDER_MANIFEST):
+    manifest = load_manifest(manifest_path)
+    hashes = {spec['path']: spec_hash(spec) for spec in specs}
+    to_render = [
+        spec for spec in specs
+        if force or manifest.get(spec['path']) != hashes[spec['path']] or not os.path.exists(spec['path'])
+    ]
+
+    if len(to_render) <= 1 or max_workers == 1:
+        rendered = [render_plot(spec) for spec in to_render]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            rendered = list(executor.map(render_plot, to_render))
+
+    # Re-read so plots another process rendered in the meantime aren't dropped
+    manifest = load_manifest(manifest_path)
+    for path in rendered:
+        manifest[path] = hashes[path]
+    save_manifest(manifest, manifest_path)
+    return rendered
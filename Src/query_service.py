@@ -0,0 +1,376 @@
+import sys
+import json
+import time
+import argparse
+import threading
+from functools import lru_cache, partial
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+from rent_proportion_processor import calculate_cost_proportion
+from rent_proportion_analysis import PREDICTED_COST_OF_LIVING_CSV
+from find_correlations import LIHS_years, correlations_csv
+from benefit_scenarios import weekly_income, share_at_least_one
+from sa2_geography import sa2_codes_for_names
+
+
+## Local HTTP/JSON service over the pipeline outputs, for dashboards that would
+## otherwise read and scan a csv per request. The predicted cost of living and
+## correlations csvs are loaded once, indexed by SA2 code, region and year, and
+## reloaded in place when a rebuild replaces them. Scenario recomputations go
+## through an LRU cache of encoded responses held by the loaded index, so a
+## reload starts a new cache rather than serving answers from the old data.
+## python query_service.py [--port 8021]
+##   GET /cost-of-living?sa2=21139&year=2016  (or region=Abbotsford, from=2011&to=2021)
+##   GET /correlations?year=2016&min=0.4  (or metric=..., max=...)
+##   GET /scenario?region=Abbotsford&year=2021&cost_of_living=150&fortnightly_payment=620.8&rent_assistance=93.87
+##   GET /status
+
+PORT = 8021
+# Outputs are checked for changes at most this often (seconds)
+RELOAD_INTERVAL = 1.0
+SCENARIO_CACHE_SIZE = 4096
+
+COST_OF_LIVING_COLUMNS = [
+    'SA2 Code', 'Region', 'Census year', 'Mean rent per person',
+    'Cost of living proportion (Youth Allowance)', 'Cost of living proportion (Newstart)'
+]
+
+_service = {'index': None, 'checked': 0.0, 'version': 0}
+_reload_lock = threading.Lock()
+
+
+def output_paths():
+    return [PREDICTED_COST_OF_LIVING_CSV, correlations_csv(LIHS_years)]
+
+
+def output_stats():
+    # (mtime, size) of each output, None for ones that don't exist yet
+    stats = []
+    for path in output_paths():
+        try:
+            stat = path.stat()
+            stats.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stats.append(None)
+    return stats
+
+
+def json_records(df):
+    # Rows as plain dicts, NaN and <NA> as None, ready for json.dumps
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def positions_by(values):
+    # {value: row positions}, positions kept in row order
+    return {key: positions for key, positions in pd.Series(values).groupby(values, sort=False).indices.items()}
+
+
+def build_index(cost_of_living_df, correlations_df, stats, version):
+    cost_of_living_df = cost_of_living_df.copy()
+    cost_of_living_df['SA2 Code'] = sa2_codes_for_names(cost_of_living_df['Region'].to_numpy())
+    # Sorted by year within each region, so every key's rows are in year order
+    cost_of_living_df = cost_of_living_df.sort_values(['Region', 'Census year'], kind='stable')
+    cost_of_living_df = cost_of_living_df.reindex(columns=COST_OF_LIVING_COLUMNS).reset_index(drop=True)
+
+    sa2_codes = cost_of_living_df['SA2 Code']
+    by_sa2 = positions_by(sa2_codes.fillna(-1).to_numpy(dtype=np.int64))
+    by_sa2.pop(-1, None)
+
+    correlations_df = correlations_df.reset_index()
+    index = {
+        'version': version,
+        'stats': stats,
+        'loaded': time.time(),
+        'records': json_records(cost_of_living_df),
+        'years': cost_of_living_df['Census year'].to_numpy(dtype=np.int64),
+        'rent': cost_of_living_df['Mean rent per person'].to_numpy(dtype=float),
+        'by_sa2': by_sa2,
+        # Region names are matched case insensitively
+        'by_region': positions_by(cost_of_living_df['Region'].str.lower().to_numpy()),
+        'by_year': positions_by(cost_of_living_df['Census year'].to_numpy(dtype=np.int64)),
+        'correlation_records': json_records(correlations_df),
+        'by_metric': positions_by(correlations_df['LIHS Metric'].to_numpy()),
+        'strengths': {
+            year: correlations_df['Correlation Strength {}'.format(year)].to_numpy(dtype=float)
+            for year in LIHS_years
+            if 'Correlation Strength {}'.format(year) in correlations_df.columns
+        },
+    }
+    index['scenario_responses'] = cached_scenario_responses(index)
+    return index
+
+
+def load_index(version):
+    # Reads the outputs, returns None if they changed while being read (e.g. mid rebuild)
+    stats = output_stats()
+    if None in stats:
+        raise FileNotFoundError('Missing output(s) {}'.format(
+            [str(path) for path, stat in zip(output_paths(), stats) if stat is None]
+        ))
+    cost_of_living_df = pd.read_csv(PREDICTED_COST_OF_LIVING_CSV, index_col=0)
+    correlations_df = pd.read_csv(correlations_csv(LIHS_years), index_col=0)
+    if output_stats() != stats:
+        return None
+    return build_index(cost_of_living_df, correlations_df, stats, version)
+
+
+def current_index():
+    # The loaded index, reloaded first if the outputs have changed since it was built.
+    # If a reload fails the previous index keeps being served
+    now = time.monotonic()
+    index = _service['index']
+    if index is not None and now - _service['checked'] < RELOAD_INTERVAL:
+        return index
+    with _reload_lock:
+        index = _service['index']
+        if index is None or (now - _service['checked'] >= RELOAD_INTERVAL and output_stats() != index['stats']):
+            try:
+                new_index = load_index(_service['version'] + 1)
+            except (OSError, ValueError, KeyError, pd.errors.ParserError) as error:
+                if index is None:
+                    raise
+                print('Reload failed, still serving version {}: {}'.format(index['version'], error), file=sys.stderr)
+                new_index = None
+            if new_index is not None:
+                _service['version'] = new_index['version']
+                _service['index'] = index = new_index
+        _service['checked'] = now
+    return index
+
+
+def int_param(params, name):
+    if name not in params:
+        return None
+    try:
+        return int(params[name])
+    except ValueError:
+        raise ValueError('{} must be a whole number'.format(name))
+
+
+def float_param(params, name, minimum=None):
+    # float() also parses 'nan' and 'inf', which have no json encoding
+    if name not in params:
+        raise ValueError('{} is required'.format(name))
+    try:
+        value = float(params[name])
+    except ValueError:
+        raise ValueError('{} must be a number'.format(name))
+    if not np.isfinite(value):
+        raise ValueError('{} must be a finite number'.format(name))
+    if minimum is not None and value < minimum:
+        raise ValueError('{} must be at least {:g}'.format(name, minimum))
+    return value
+
+
+def select_rows(index, sa2=None, region=None, year=None, year_from=None, year_to=None):
+    # Row positions for an SA2 or region (or every row), in year order within each
+    # region, then narrowed to one year or a range of years
+    if sa2 is not None:
+        positions = index['by_sa2'].get(sa2)
+    elif region is not None:
+        positions = index['by_region'].get(region.lower())
+    elif year is not None:
+        positions = index['by_year'].get(year, np.empty(0, dtype=np.int64))
+    else:
+        positions = np.arange(len(index['records']))
+    if positions is None:
+        raise LookupError('No cost of living data for {}'.format(
+            'SA2 {}'.format(sa2) if sa2 is not None else 'region {}'.format(region)
+        ))
+
+    years = index['years'][positions]
+    keep = np.ones(len(positions), dtype=bool)
+    if year is not None:
+        keep &= years == year
+    if year_from is not None:
+        keep &= years >= year_from
+    if year_to is not None:
+        keep &= years <= year_to
+    return positions[keep]
+
+
+def cost_of_living_query(index, params):
+    positions = select_rows(
+        index,
+        sa2=int_param(params, 'sa2'),
+        region=params.get('region'),
+        year=int_param(params, 'year'),
+        year_from=int_param(params, 'from'),
+        year_to=int_param(params, 'to'),
+    )
+    return {'version': index['version'], 'rows': [index['records'][position] for position in positions]}
+
+
+def correlations_query(index, params):
+    if 'metric' in params:
+        positions = index['by_metric'].get(params['metric'])
+        if positions is None:
+            raise LookupError('No correlations for metric {}'.format(params['metric']))
+    else:
+        positions = np.arange(len(index['correlation_records']))
+
+    year = params.get('year')
+    if year is not None and year not in index['strengths']:
+        raise ValueError('year must be one of {}'.format(sorted(index['strengths'])))
+    if 'min' in params or 'max' in params:
+        if year is None:
+            raise ValueError('min and max filter on the correlation strength of a year, so need year')
+        # Compared by absolute value, strong negative correlations are as interesting as positive ones
+        strengths = np.abs(index['strengths'][year][positions])
+        keep = np.ones(len(positions), dtype=bool)
+        if 'min' in params:
+            keep &= strengths >= float_param(params, 'min')
+        if 'max' in params:
+            keep &= strengths <= float_param(params, 'max')
+        positions = positions[keep]
+
+    rows = [index['correlation_records'][position] for position in positions]
+    if year is not None:
+        # Only the metric and that year's columns
+        suffix = ' {}'.format(year)
+        rows = [
+            {key[:-len(suffix)] if key.endswith(suffix) else key: value
+             for key, value in row.items() if key == 'LIHS Metric' or key.endswith(suffix)}
+            for row in rows
+        ]
+    return {'version': index['version'], 'rows': rows}
+
+
+def scenario_response(index, sa2, region, year, cost_of_living, fortnightly_payment, rent_assistance):
+    # Encoded response of a scenario query, cached per index by cached_scenario_responses
+    positions = select_rows(index, sa2=sa2, region=region, year=year)
+    if not len(positions):
+        raise LookupError('No rent data for year {}'.format(year))
+
+    income = weekly_income({'Fortnightly payment': fortnightly_payment, 'Rent assistance': rent_assistance})
+    proportions = calculate_cost_proportion(index['rent'][positions], cost_of_living, income)
+    rows = [
+        {
+            'SA2 Code': index['records'][position]['SA2 Code'],
+            'Region': index['records'][position]['Region'],
+            'Census year': year,
+            'Mean rent per person': index['records'][position]['Mean rent per person'],
+            'Cost of living proportion': None if np.isnan(proportion) else float(proportion),
+        }
+        for position, proportion in zip(positions, proportions)
+    ]
+    share = share_at_least_one(pd.DataFrame({'Scenario': proportions})).iloc[0]
+    return json.dumps({
+        'version': index['version'],
+        'weekly_income': income,
+        'share_at_least_one': None if np.isnan(share) else float(share),
+        'rows': rows,
+    }).encode('utf-8')
+
+
+def cached_scenario_responses(index):
+    # scenario_response over index's data behind an LRU cache, so a cached
+    # response always comes from the index it's stored with
+    return lru_cache(maxsize=SCENARIO_CACHE_SIZE)(partial(scenario_response, index))
+
+
+def scenario_query(index, params):
+    year = int_param(params, 'year')
+    if year is None:
+        raise ValueError('year is required')
+    fortnightly_payment = float_param(params, 'fortnightly_payment', minimum=0)
+    rent_assistance = float_param(params, 'rent_assistance', minimum=0)
+    # Proportions are divided by the weekly income
+    if fortnightly_payment + rent_assistance <= 0:
+        raise ValueError('fortnightly_payment and rent_assistance must add up to more than 0')
+    return index['scenario_responses'](
+        int_param(params, 'sa2'),
+        params.get('region'),
+        year,
+        float_param(params, 'cost_of_living'),
+        fortnightly_payment,
+        rent_assistance,
+    )
+
+
+def status_query(index, params):
+    cache_info = index['scenario_responses'].cache_info()
+    return {
+        'version': index['version'],
+        'loaded': index['loaded'],
+        'outputs': [str(path) for path in output_paths()],
+        'cost_of_living_rows': len(index['records']),
+        'correlation_rows': len(index['correlation_records']),
+        'scenario_cache': {'hits': cache_info.hits, 'misses': cache_info.misses, 'size': cache_info.currsize},
+    }
+
+
+ROUTES = {
+    '/cost-of-living': cost_of_living_query,
+    '/correlations': correlations_query,
+    '/scenario': scenario_query,
+    '/status': status_query,
+}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a dashboard can reuse one connection for many lookups
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, which Nagle's algorithm would hold back ~40ms
+    disable_nagle_algorithm = True
+    log_requests = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        # Last value wins for repeated parameters
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path not in ROUTES:
+                raise LookupError('Unknown path {}, try one of {}'.format(url.path, sorted(ROUTES)))
+            response = ROUTES[url.path](current_index(), params)
+            status = 200
+        # Bad parameters are a 400, lookups that match nothing a 404
+        except LookupError as error:
+            response, status = {'error': str(error)}, 404
+        except ValueError as error:
+            response, status = {'error': str(error)}, 400
+        if not isinstance(response, bytes):
+            response = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        if self.log_requests:
+            super().log_message(format, *args)
+
+
+def make_server(host='127.0.0.1', port=PORT, log_requests=False):
+    # Loads the outputs up front so the first request doesn't pay for it
+    current_index()
+    QueryHandler.log_requests = log_requests
+    return ThreadingHTTPServer((host, port), QueryHandler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve cost of living, correlation and benefit scenario lookups as json'
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: localhost only)')
+    parser.add_argument('--port', type=int, default=PORT, help='Port to listen on (default: {})'.format(PORT))
+    parser.add_argument('--log-requests', action='store_true', help='Log every request to stderr')
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.log_requests)
+    print('Serving on http://{}:{}/ (routes: {})'.format(args.host, args.port, ', '.join(sorted(ROUTES))))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
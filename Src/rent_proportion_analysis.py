@@ -1,23 +1,55 @@
+import argparse
+from numbers import Integral
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from rent_proportion_processor import calculate_cost_proportion
+from rent_proportion_processor import add_cost_of_living_proportions, COST_OF_LIVING_CSV
+from benefit_scenarios import CENSUS_SCENARIOS, share_at_least_one
+from paths import DATASETS_DIR, OUTPUT_DIR, PLOTS_DIR
+from plot_render import plot_spec, render_plots
+import instrumentation
+from instrumentation import instrumented
+
+
+PREDICTED_COST_OF_LIVING_CSV = OUTPUT_DIR / 'Predicted-Cost-of-Living-By-SA2-Year.csv'
+
+# Years after this are predicted from CPI rather than census data
+LAST_CENSUS_YEAR = 2016
 
+# Years predicted unless --predict-years says otherwise
+PREDICT_YEARS = [2021]
 
+# 'predict' writes the predicted cost of living csv, 'plot' draws the scatters by year
+STAGES = ['predict', 'plot']
+
+
+@instrumented
 def count_cost_of_living(cost_of_living_df):
-    cost_of_living_by_year_groups = cost_of_living_df.groupby(['Census year'])
+    # Returns a plot spec per year, see plot_render.render_plots
+    plot_specs = []
+    cost_of_living_by_year_groups = cost_of_living_df.groupby('Census year')
 
     for name, group in cost_of_living_by_year_groups:
-        youth_total = len(group['Cost of living proportion (Youth Allowance)'].values)
-        newstart_total = len(group['Cost of living proportion (Newstart)'].values)
-        youth_amount_over_1 = sum([1 for x in group['Cost of living proportion (Youth Allowance)'].values if x >= 1])
-        newstart_amount_over_1 = sum([1 for x in group['Cost of living proportion (Newstart)'].values if x >= 1])
-#         print('YEAR: ' + str(name))
-#         print('NUMBER OVER 1: ' + str(amount_over_1))
-#         print('TOTAL: ' + str(total))
-        youth_proportion = youth_amount_over_1 / youth_total
-        newstart_proportion = newstart_amount_over_1 / newstart_total
-#         print('PROPORTION ' + str(proportion))
-        plot_cost_of_living(group, name, youth_proportion, newstart_proportion)
+        # Share of regions with a proportion >= 1, for both benefits at once
+        proportions_over_1 = share_at_least_one(
+            group[['Cost of living proportion (Youth Allowance)', 'Cost of living proportion (Newstart)']]
+        )
+        youth_proportion = proportions_over_1['Cost of living proportion (Youth Allowance)']
+        newstart_proportion = proportions_over_1['Cost of living proportion (Newstart)']
+        plot_specs.append(plot_cost_of_living(group, name, youth_proportion, newstart_proportion))
+    return plot_specs
+
+
+def plotted_years(predict_years=PREDICT_YEARS):
+    # Years the 'plot' stage draws: the census years with a benefit scenario
+    # (2006 has none, so it's left out of the cost of living) and the predicted years
+    scenario_years = CENSUS_SCENARIOS['Census year']
+    census_years = scenario_years[scenario_years <= LAST_CENSUS_YEAR]
+    return sorted(set(census_years.tolist()) | set(predict_years))
+
+
+def cost_of_living_plot_png(year):
+    return PLOTS_DIR / 'cost_of_living_scatter_{}.png'.format(year)
 
 
 def plot_cost_of_living(cost_of_living_df, year, youth_proportion, newstart_proportion):
@@ -36,27 +68,39 @@ def plot_cost_of_living(cost_of_living_df, year, youth_proportion, newstart_prop
 #     plt.grid(True)
 #     plt.savefig(fname='../Plots/cost_of_living_scatter_{}.png'.format(year))
 #     #plt.savefig(fname='../Plots/adjusted-cost_of_living_scatter_{}.png'.format(year))
-    fig, ax = plt.subplots()
+    return plot_spec(
+        cost_of_living_plot_png(year),
+        draw_cost_of_living,
+        regions=cost_of_living_df['Region'].tolist(),
+        youth_values=cost_of_living_df['Cost of living proportion (Youth Allowance)'].to_numpy(),
+        newstart_values=cost_of_living_df['Cost of living proportion (Newstart)'].to_numpy(),
+        year=year,
+        youth_proportion=youth_proportion,
+        newstart_proportion=newstart_proportion
+    )
+
+
+def draw_cost_of_living(fig, regions, youth_values, newstart_values, year, youth_proportion, newstart_proportion):
+    ax = fig.add_subplot()
     ax.scatter(
-        cost_of_living_df['Region'], cost_of_living_df['Cost of living proportion (Youth Allowance)'], color='green', s=5, label='Youth Allowance'
+        regions, youth_values, color='green', s=5, label='Youth Allowance'
     )
     ax.scatter(
-        cost_of_living_df['Region'], cost_of_living_df['Cost of living proportion (Newstart)'], color='red', s=5, label='Newstart'
+        regions, newstart_values, color='red', s=5, label='Newstart'
     )
     ax.legend()
     ax.plot(markersize=0.3)
-    if year == 2021:
-        plt.title('Predicted Cost of Living Proportion by Suburb for {}'.format(year))
+    if year > LAST_CENSUS_YEAR:
+        ax.set_title('Predicted Cost of Living Proportion by Suburb for {}'.format(year))
     else:
-        plt.title('Actual Cost of Living Proportion by Suburb for {}'.format(year))
-        #plt.savefig(fname='../Plots/adjusted-cost_of_living_scatter_{}.png'.format(year))
-    plt.xscale('linear')
-    plt.yscale('linear')
-    plt.tick_params(bottom=False, labelbottom=False)
-    plt.xlabel('Youth Allowance Percentage > 1 = {:.2f}%\nNewstart Percentage > 1 = {:.2f}%'.format(youth_proportion * 100, newstart_proportion * 100))
-    plt.ylabel('Cost of Living Proportion')
+        ax.set_title('Actual Cost of Living Proportion by Suburb for {}'.format(year))
+        #fig.savefig(fname='../Plots/adjusted-cost_of_living_scatter_{}.png'.format(year))
+    ax.set_xscale('linear')
+    ax.set_yscale('linear')
+    ax.tick_params(bottom=False, labelbottom=False)
+    ax.set_xlabel('Youth Allowance Percentage > 1 = {:.2f}%\nNewstart Percentage > 1 = {:.2f}%'.format(youth_proportion * 100, newstart_proportion * 100))
+    ax.set_ylabel('Cost of Living Proportion')
     ax.grid(True)
-    plt.savefig(fname='../Plots/cost_of_living_scatter_{}.png'.format(year))
 
 
 def plot_average_rent_over_years(cost_of_living_df):
@@ -68,56 +112,116 @@ def plot_average_rent_over_years(cost_of_living_df):
     # print(rent_groups)
 
 
+@instrumented
+def load_cpi_factors():
+    # Cumulative rent CPI growth since the 2016 census, indexed by quarter
+    rent_cpi_df = pd.read_csv(DATASETS_DIR / 'CPI-Housing-Since-2016.csv')
+    quarters = pd.PeriodIndex(
+        pd.to_datetime(rent_cpi_df['Quarter'], format='%b-%Y'), freq='Q'
+    )
+    cpi_factors = np.cumprod(1 + rent_cpi_df['Percentage increase'].to_numpy() / 100)
+    return pd.Series(cpi_factors, index=quarters, name='CPI factor')
+
+
+def cpi_factor_for(cpi_factors_srs, target):
+    # Target is a year (uses the latest quarter available in that year) or a quarter, e.g. '2021Q1'.
+    # A year given as a string, e.g. '2021', is still a year rather than its first quarter
+    is_year = isinstance(target, Integral) or (isinstance(target, str) and target.strip().isdigit())
+    target_quarter = pd.Period('{}Q4'.format(int(target)) if is_year else target, freq='Q')
+    last_quarter = cpi_factors_srs.index[-1]
+    if target_quarter.year > last_quarter.year or target_quarter < cpi_factors_srs.index[0]:
+        raise ValueError('No CPI data for {}, CPI data covers {} to {}'.format(
+            target, cpi_factors_srs.index[0], last_quarter
+        ))
+    quarter = min(target_quarter, last_quarter)
+    return quarter, cpi_factors_srs[quarter]
+
+
 # Regression not appropriate as it'll be extrapolating beyond observed range
 # Therefore, use CPI to estimate the increase in rent prices from average
 # rent in 2016, then calculate cost of living from this value
-def predict_rent_2021(cost_of_living_df):
+@instrumented
+def project_rent_with_cpi(cost_of_living_df, targets, cpi_factors_srs=None):
+    if cpi_factors_srs is None:
+        cpi_factors_srs = load_cpi_factors()
+    quarters, factors = zip(*[cpi_factor_for(cpi_factors_srs, target) for target in targets])
+    factors = np.array(factors)
+
+    rent_2016_df = cost_of_living_df.loc[
+        cost_of_living_df['Census year'] == LAST_CENSUS_YEAR,
+        ['Region', 'Mean rent per person']
+    ]
+    # Regions x targets, every projection in one step
+    projected_rent = rent_2016_df['Mean rent per person'].to_numpy()[:, None] * factors[None, :]
+
+    n_regions = len(rent_2016_df)
+    return pd.DataFrame({
+        'Region': np.repeat(rent_2016_df['Region'].to_numpy(), len(factors)),
+        'Census year': np.tile([quarter.year for quarter in quarters], n_regions),
+        'CPI quarter': np.tile([str(quarter) for quarter in quarters], n_regions),
+        'Mean rent per person': projected_rent.ravel()
+    })
+
+
+@instrumented
+def predict_rent(cost_of_living_df, years, scenarios_df=CENSUS_SCENARIOS):
     # Remove index column
     cost_of_living_df = cost_of_living_df.loc[
         :,
         ['Region', 'Census year', 'Mean rent per person', 'Cost of living proportion (Youth Allowance)', 'Cost of living proportion (Newstart)']
     ]
-    rent_cpi_df = pd.read_csv('../Datasets/CPI-Housing-Since-2016.csv')
-    rent_cpi_quarterly_increase = rent_cpi_df['Percentage increase'].values
-    cost_of_living_df_2016 = cost_of_living_df.loc[
-        cost_of_living_df['Census year'] == 2016,
-        ['Region', 'Census year', 'Mean rent per person']
-    ]
+    projected_df = project_rent_with_cpi(cost_of_living_df, years).drop(columns='CPI quarter')
 
-    print(cost_of_living_df_2016)
-    cost_of_living_2021_df = pd.DataFrame(
-        columns=['Region', 'Census year', 'Mean rent per person']
+    # Youth Allowance and Jobseeker scenarios for the predicted years, see benefit_scenarios.CENSUS_SCENARIOS.
+    # Years without a scenario are left without a cost of living proportion
+    projected_df = add_cost_of_living_proportions(
+        projected_df, scenarios_df.loc[scenarios_df['Census year'].isin(years), :]
     )
-    for index, row in cost_of_living_df_2016.iterrows():
-        rent_2021 = row['Mean rent per person']
-        for i in rent_cpi_quarterly_increase:
-            rent_2021 = rent_2021 * (1 + (i / 100))
-        row_2021 = {
-            'Region': row['Region'],
-            'Census year': 2021,
-            'Mean rent per person': rent_2021
-        }
-        cost_of_living_2021_df = cost_of_living_2021_df.append(row_2021, ignore_index=True)
-
-    # Cost of living = 100 [Groceries] + 50 [Transport, bills etc.]
-    # Youth Allowance/Austudy/Jobseeker under 22 [512.50 + 93.87 = 606.37 fornightly]
-    cost_of_living_2021_df['Cost of living proportion (Youth Allowance)'] = calculate_cost_proportion(cost_of_living_2021_df['Mean rent per person'], 150, 303.185)
-    # Jobseeker over 22 [620.80 + 93.87 = 714.67 fornightly]
-    cost_of_living_2021_df['Cost of living proportion (Newstart)'] = calculate_cost_proportion(cost_of_living_2021_df['Mean rent per person'], 150, 357.335)
-
-    predicted_cost_of_living_df = cost_of_living_df.append(cost_of_living_2021_df, ignore_index=True)
+
+    predicted_cost_of_living_df = pd.concat([cost_of_living_df, projected_df], ignore_index=True)
     predicted_cost_of_living_df.sort_values(by=['Region', 'Census year'], inplace=True)
 
     return predicted_cost_of_living_df
 
 
+def predict_rent_2021(cost_of_living_df):
+    return predict_rent(cost_of_living_df, [2021])
 
 
-cost_of_living_df = pd.read_csv('../OutputCSV/Cost-of-Living-By-SA2-Year-2006-2011-2016.csv')
-#cost_of_living_df = pd.read_csv('../OutputCSV/Adjusted-Cost-of-Living-By-SA2-Year-2006-2011-2016.csv')
-#count_cost_of_living(cost_of_living_df)
-#plot_average_rent_over_years(cost_of_living_df)
-predicted_cost_of_living_df = predict_rent_2021(cost_of_living_df)
-predicted_cost_of_living_df.to_csv('../OutputCSV/Predicted-Cost-of-Living-By-SA2-Year.csv')
-count_cost_of_living(predicted_cost_of_living_df)
-
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Predict and plot the cost of living proportion by SA2 and year'
+    )
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=STAGES,
+        default=STAGES,
+        help='Stages to run (default: all)'
+    )
+    parser.add_argument(
+        '--predict-years',
+        nargs='+',
+        type=int,
+        default=PREDICT_YEARS,
+        help='Years to predict rent for from the {} census and CPI (default: {})'.format(
+            LAST_CENSUS_YEAR, ' '.join(map(str, PREDICT_YEARS))
+        )
+    )
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.enable_from_arguments(args)
+
+    if 'predict' in args.stages:
+        cost_of_living_df = pd.read_csv(COST_OF_LIVING_CSV)
+        #cost_of_living_df = pd.read_csv(OUTPUT_DIR / 'Adjusted-Cost-of-Living-By-SA2-Year-2006-2011-2016.csv')
+        #plot_average_rent_over_years(cost_of_living_df)
+        predicted_cost_of_living_df = predict_rent(cost_of_living_df, args.predict_years)
+        predicted_cost_of_living_df.to_csv(PREDICTED_COST_OF_LIVING_CSV)
+    if 'plot' in args.stages:
+        predicted_cost_of_living_df = pd.read_csv(PREDICTED_COST_OF_LIVING_CSV, index_col=0)
+        render_plots(count_cost_of_living(predicted_cost_of_living_df))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,32 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-import re
+
+from weighted_stats import group_weighted_mean
+from binned_distribution import parse_brackets
+from frame_cache import cache_key, load_or_build
+from benefit_scenarios import CENSUS_SCENARIOS, weekly_income
+from census_schema import census_csv_path, read_census_csv, read_census_csvs, drop_labels
+from sa2_geography import sa2_codes_for_names, crosswalk_source_files
+from paths import DATASETS_DIR, OUTPUT_DIR
+import instrumentation
+from instrumentation import instrumented
+
+
+DWELLING_CSV = census_csv_path('dwelling')
+RENT_CSV = census_csv_path('rent')
+COST_OF_LIVING_CSV = OUTPUT_DIR / 'Cost-of-Living-By-SA2-Year-2006-2011-2016.csv'
+
+# Partitioned mode reads every city's or state's extract, e.g. Rent-Weekly-By-SA2-Sydney-2006-2011-2016.csv,
+# as well as the Melbourne one
+DWELLING_CSV_PATTERN = 'Dwelling-Structure-And-Number-Of-Bedrooms-By-SA2-*2006-2011-2016.csv'
+RENT_CSV_PATTERN = 'Rent-Weekly-By-SA2-*2006-2011-2016.csv'
+NATIONAL_COST_OF_LIVING_CSV = OUTPUT_DIR / 'National-Cost-of-Living-By-SA2-Year-2006-2011-2016.csv'
+
+# 'rent' refreshes the cached bedroom and rent tables, 'cost-of-living' also writes the output csv
+STAGES = ['rent', 'cost-of-living']
 
 
 def bedroom_string_to_int(bedroom_string):
@@ -16,216 +42,295 @@ def bedroom_string_to_int(bedroom_string):
     return str_to_int_dict[split_string[0]]
 
 
-def rent_range_to_average(rent_range_string):
-    bounds = re.findall("\\d+", rent_range_string)
-    if len(bounds) == 1:
-        # Sanity check as only rent entry that should trigger this is '950 and over'
-        assert(int(bounds[0]) == 950)
-        return bounds[0]
-    assert(len(bounds) == 2)
-    return (int(bounds[0]) + int(bounds[1])) / 2
-
+def rent_ranges_to_midpoints(rent_range_srs):
+    # Parse each distinct bracket label once, e.g. '$150-$199' -> 174.5.
+    # Open-ended brackets like '950 and over' only have a lower bound, so use that
+    midpoints_srs = parse_brackets(rent_range_srs.unique())['Midpoint']
+    # Sanity check that every label had at least a lower bound
+    assert(not midpoints_srs.isna().any())
+    return rent_range_srs.map(midpoints_srs).astype(float)
 
-def calculate_average_bedrooms_df():
-    # Num Bedrooms per dwelling dataset
-    dwelling_df = pd.read_csv('../Datasets/Dwelling-Structure-And-Number-Of-Bedrooms-By-SA2-2006-2011-2016.csv', encoding = 'ISO-8859-1')
-    # Trim unneeded columns
-    dwelling_df = dwelling_df.loc[
-        :,
-        ['Number of Bedrooms', 'Dwelling Structure', 'Region', 'Census year', 'Value']
-    ].replace(
-        ['Total', 'Not stated', 'None (includes bedsitters)'],
-        np.nan
-    ).dropna()
 
-    dwelling_df['Number of Bedrooms'] = dwelling_df['Number of Bedrooms'].apply(bedroom_string_to_int)
+@instrumented
+def calculate_average_bedrooms_df(dwelling_df=None):
+    # Num Bedrooms per dwelling dataset, only the columns we need
+    if dwelling_df is None:
+        dwelling_df = read_census_csv('dwelling', path=DWELLING_CSV)
+    # Trim unneeded entries
+    dwelling_df = drop_labels(dwelling_df, ['Total', 'Not stated', 'None (includes bedsitters)'])
 
-    # Essentially the cleaned dwelling_df, but sorted for better viewing.
-    dwelling_df = dwelling_df.groupby(
-        ['Region', 'Dwelling Structure', 'Census year', 'Number of Bedrooms']
-    ).sum()
+    # Map each distinct bedroom label once rather than once per row
+    dwelling_df['Number of Bedrooms'] = dwelling_df['Number of Bedrooms'].map(
+        {label: bedroom_string_to_int(label) for label in dwelling_df['Number of Bedrooms'].cat.categories}
+    ).astype('int8')
 
     # TEST: Run a diff, see if the csvs are still the same
     # dwelling_df.set_index(['Dwelling Structure', 'Region', 'Census year', 'Number of Bedrooms'], inplace=True)
     # dwelling_df.sort_values(by=['Dwelling Structure', 'Region', 'Census year', 'Number of Bedrooms'], inplace=True)
 
-    # Total count of houses of each dwelling type
-    dwelling_groups_totals_df = dwelling_df.groupby(
-        ['Region', 'Dwelling Structure', 'Census year']
-    ).sum().rename(columns={'Value': 'Total'})
-    dwelling_groups_totals_df['Average Bedrooms'] = 0
-
-    # This loop may take a while on your machine, give it a minute or two
-    for index, row in dwelling_groups_totals_df.iterrows():
-        mean = 0
-        # Avoid division by 0 errors in below loop
-        if row['Total'] == 0:
-            continue
-        for i in range(1, 7):
-            full_index = (index[0], index[1], index[2], i)
-            # num houses of particular dwelling type and bedroom count * num bedrooms / total num of bedrooms of that dwelling type
-            weighted_element = dwelling_df.loc[full_index].values[0] * i / row['Total']
-            mean += weighted_element
-        dwelling_groups_totals_df.loc[index, 'Average Bedrooms'] = mean
-
+    # Total count of houses of each dwelling type, and the mean number of bedrooms
+    # weighted by the count of houses with that many bedrooms
+    dwelling_groups_totals_df = group_weighted_mean(
+        dwelling_df,
+        ['Region', 'Dwelling Structure', 'Census year'],
+        value_col='Number of Bedrooms',
+        weight_col='Value',
+        mean_name='Average Bedrooms'
+    )
 
     # TEST: Just a save to peruse the results :D
-    # dwelling_df.to_csv('../Datasets/dwelling-test.csv')
-    # dwelling_groups_df.to_csv('../Datasets/dwelling-groups-sum-test.csv')
     # dwelling_groups_totals_df.to_csv('../Datasets/dwelling-groups-totals-test.csv')
 
     return dwelling_groups_totals_df
 
 
-def calculate_average_rent(average_bedrooms_df):
-    weekly_rent_df = pd.read_csv('../Datasets/Rent-Weekly-By-SA2-Melbourne-2006-2011-2016.csv')
-    # Trim unneeded columns and entries
-    weekly_rent_df = weekly_rent_df.loc[
-        :,
-        ['Dwelling Structure', 'Rent (weekly)', 'Region', 'Census year', 'Value']
-    ].replace(
-        ['Total', 'Not stated', 'Nil payments'],
-        np.nan
-    ).dropna()
-
-    weekly_rent_df['Rent (weekly)'] = weekly_rent_df['Rent (weekly)'].apply(rent_range_to_average)
-    weekly_rent_df.set_index(
-        ['Region', 'Dwelling Structure', 'Census year', 'Rent (weekly)'],
-        inplace=True
-    )
-    weekly_rent_df.sort_values(
-        by=['Region', 'Dwelling Structure', 'Census year'],
-        inplace=True
-    )
+@instrumented
+def calculate_rent_per_dwelling_df(average_bedrooms_df, weekly_rent_df=None):
+    if weekly_rent_df is None:
+        weekly_rent_df = read_census_csv('rent', path=RENT_CSV)
+    # Trim unneeded entries
+    weekly_rent_df = drop_labels(weekly_rent_df, ['Total', 'Not stated', 'Nil payments'])
+
+    # Treat the rent brackets as a histogram, each bracket sitting at its midpoint.
+    # Midpoints are truncated to whole dollars as the checked-in tables were built that way
+    weekly_rent_df['Rent (weekly)'] = np.trunc(rent_ranges_to_midpoints(weekly_rent_df['Rent (weekly)']))
 
-    # Sum the totals for later use in weighted mean
-    weekly_rent_dwelling_totals_df = weekly_rent_df.groupby(
-        ['Region', 'Dwelling Structure', 'Census year']
-    ).sum().rename(columns={'Value': 'Total'})
-    weekly_rent_region_totals_df = weekly_rent_dwelling_totals_df.groupby(
-        ['Region', 'Census year']
-    ).sum().rename(columns={'Value': 'Total'})
-
-    idx = pd.IndexSlice
-    # UNCOMMENT THIS LOOP IF CALCULATING FROM SCRATCH
-#     weekly_rent_dwelling_totals_df['Mean rent per dwelling'] = 0
-#     for index, row in weekly_rent_dwelling_totals_df.iterrows():
-#         mean = 0
-#         average_bedrooms_per_dwelling = average_bedrooms_df.loc[index, 'Average Bedrooms']
-#         if row['Total'] == 0 or average_bedrooms_per_dwelling == 0:
-#             continue
-#         weekly_rent_slice_df = weekly_rent_df.loc[idx[index[0], index[1], index[2], :], :]
-#         for index0, row0 in weekly_rent_slice_df.iterrows():
-#             weekly_rent_count = int(row0[0])
-#             rent_range = int(index0[3])
-#             # print('Weekly rent count for the dwelling type: ' + str(weekly_rent_count))
-#             # print('This should be rent range: ' + str(index0[3]))
-#             mean += rent_range * weekly_rent_count / row['Total']
-#         mean = mean / average_bedrooms_per_dwelling
-#         weekly_rent_dwelling_totals_df.loc[index, 'Mean rent per dwelling'] = mean
-
-    # TEST: These are to avoid running the above loop. Comment out later
-    # for full functionality
-    weekly_rent_dwelling_totals_df = pd.read_csv('../Datasets/weekly-rent-dwelling-totals-test.csv')
-    weekly_rent_dwelling_totals_df.set_index(
+    # Total rentals and mean weekly rent of each dwelling type
+    weekly_rent_dwelling_totals_df = group_weighted_mean(
+        weekly_rent_df,
         ['Region', 'Dwelling Structure', 'Census year'],
-        inplace=True
+        value_col='Rent (weekly)',
+        weight_col='Value',
+        mean_name='Mean rent per dwelling'
     )
 
-    weekly_rent_region_totals_df['Mean rent per person'] = 0
-    for index, row in weekly_rent_region_totals_df.iterrows():
-        mean = 0
-        total_rental_properties = row['Total']
-        if total_rental_properties == 0:
-            continue
-        weekly_rent_per_dwelling_slice = weekly_rent_dwelling_totals_df.loc[
-            idx[index[0], :, index[1]],
-            :
-        ]
-        for index0, row0 in weekly_rent_per_dwelling_slice.iterrows():
-            total_dwelling_count = int(row0['Total'])
-            mean_dwelling_rent = int(row0['Mean rent per dwelling'])
-            mean += mean_dwelling_rent * total_dwelling_count / total_rental_properties
-        weekly_rent_region_totals_df.loc[index, 'Mean rent per person'] = mean
+    # Split the rent of each dwelling across its average number of bedrooms.
+    # Dwellings with no bedroom data are left at 0
+    average_bedrooms = average_bedrooms_df['Average Bedrooms'].reindex(
+        weekly_rent_dwelling_totals_df.index
+    ).fillna(0).to_numpy(dtype=float)
+    mean_rent = weekly_rent_dwelling_totals_df['Mean rent per dwelling'].to_numpy()
+    weekly_rent_dwelling_totals_df['Mean rent per dwelling'] = np.divide(
+        mean_rent, average_bedrooms,
+        out=np.zeros(len(mean_rent)),
+        where=average_bedrooms != 0
+    )
 
     # TEST: Have a look, see if everything is all good
-    # weekly_rent_df.to_csv('../Datasets/weekly-rent-test.csv')
     # weekly_rent_dwelling_totals_df.to_csv('../Datasets/weekly-rent-dwelling-totals-test.csv')
+
+    return weekly_rent_dwelling_totals_df
+
+
+@instrumented
+def calculate_rent_per_person_df(weekly_rent_dwelling_totals_df):
+    # Per dwelling means are truncated to whole dollars as the checked-in tables were built that way
+    weekly_rent_dwelling_df = weekly_rent_dwelling_totals_df.reset_index()
+    weekly_rent_dwelling_df['Mean rent per dwelling'] = np.trunc(
+        weekly_rent_dwelling_df['Mean rent per dwelling']
+    )
+
+    # Mean rent per person of each region, weighted by the number of rentals of each dwelling type
+    weekly_rent_region_totals_df = group_weighted_mean(
+        weekly_rent_dwelling_df,
+        ['Region', 'Census year'],
+        value_col='Mean rent per dwelling',
+        weight_col='Total',
+        mean_name='Mean rent per person'
+    )
+
+    # TEST: Have a look, see if everything is all good
     # weekly_rent_region_totals_df.to_csv('../Datasets/weekly-rent-region-totals-test.csv')
 
     return weekly_rent_region_totals_df
 
 
-def calculate_cost_proportion(average_rent_per_person_srs, cost_of_living, centrelink_weekly_income):
-    cost_of_living_proportion_srs = average_rent_per_person_srs.apply(
-        lambda x: (x + cost_of_living) / centrelink_weekly_income
+def calculate_average_rent(average_bedrooms_df, weekly_rent_df=None):
+    weekly_rent_dwelling_totals_df = calculate_rent_per_dwelling_df(average_bedrooms_df, weekly_rent_df)
+    return calculate_rent_per_person_df(weekly_rent_dwelling_totals_df)
+
+
+def region_state_codes(region_srs):
+    # State code of each row's SA2 (by name, see sa2_geography.py), 0 for regions not in the crosswalk.
+    # Names are looked up once per category
+    codes = sa2_codes_for_names(region_srs.cat.categories)
+    category_states = codes.fillna(0).to_numpy(dtype=np.int64) // 10**4
+    return category_states[region_srs.cat.codes.to_numpy()]
+
+
+def partition_by_state(df):
+    # {state code: rows of df in that state}
+    return {
+        int(state): partition_df
+        for state, partition_df in df.groupby(region_state_codes(df['Region']), sort=True)
+    }
+
+
+def partition_average_rent(partition):
+    # Bedroom and rent aggregation of one partition, run in a worker process.
+    # Every region is in exactly one partition, so no group spans two of them
+    dwelling_df, weekly_rent_df = partition
+    average_bedrooms_df = calculate_average_bedrooms_df(dwelling_df)
+    rent_per_person_df = calculate_average_rent(average_bedrooms_df, weekly_rent_df)
+    # Plain string regions so partitions with different categories line up when merged
+    return rent_per_person_df.set_axis(
+        rent_per_person_df.index.set_levels(rent_per_person_df.index.levels[0].astype(str), level='Region'),
+        axis=0
     )
 
-#     cost_of_living_df = average_rent_per_person_df.reindex(
-#         columns=['Region', 'Census year', 'Mean rent per person', 'Cost of living proportion']
-#     )
+
+@instrumented
+def calculate_average_rent_partitioned(dwelling_paths=None, rent_paths=None, max_workers=None):
+    # Rent per person of every region in every dwelling and rent extract, with
+    # each state aggregated in its own process. Returns the rows of all states
+    # with the regions' 5-digit SA2 and state codes
+    if dwelling_paths is None:
+        dwelling_paths = sorted(DATASETS_DIR.glob(DWELLING_CSV_PATTERN))
+    if rent_paths is None:
+        rent_paths = sorted(DATASETS_DIR.glob(RENT_CSV_PATTERN))
+    if not dwelling_paths or not rent_paths:
+        raise FileNotFoundError('No {} extracts in {}'.format(
+            'dwelling' if not dwelling_paths else 'rent', DATASETS_DIR
+        ))
+    dwelling_df = read_census_csvs('dwelling', dwelling_paths)
+    dwelling_partitions = partition_by_state(dwelling_df)
+    rent_partitions = partition_by_state(read_census_csvs('rent', rent_paths))
+
+    # Only states with rents give rows, states without bedroom counts get an empty dwelling table
+    states = sorted(rent_partitions)
+    empty_dwelling_df = dwelling_df.iloc[0:0]
+    partitions = [(dwelling_partitions.get(state, empty_dwelling_df), rent_partitions[state]) for state in states]
+    if max_workers == 1 or len(partitions) <= 1:
+        results = list(map(partition_average_rent, partitions))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(partition_average_rent, partitions))
+
+    rent_per_person_df = pd.concat(results).sort_index().reset_index()
+    codes = sa2_codes_for_names(rent_per_person_df['Region'].to_numpy())
+    rent_per_person_df.insert(0, 'SA2 Code', codes)
+    rent_per_person_df.insert(0, 'State Code', (codes // 10**4).fillna(0).astype('int8'))
+    return rent_per_person_df
+
+
+@instrumented
+def load_national_rent_per_person_df(max_workers=None):
+    # calculate_average_rent_partitioned, kept in the frame cache until one of
+    # the extracts or the files the SA2 crosswalk is built from changes
+    dwelling_paths = sorted(DATASETS_DIR.glob(DWELLING_CSV_PATTERN))
+    rent_paths = sorted(DATASETS_DIR.glob(RENT_CSV_PATTERN))
+    crosswalk_paths = [path for path, _, _ in crosswalk_source_files()]
+    key = cache_key('national-rent-per-person', dwelling_paths + rent_paths + crosswalk_paths)
+    return load_or_build(key, lambda: calculate_average_rent_partitioned(dwelling_paths, rent_paths, max_workers))
+
+
+def calculate_cost_proportion(average_rent_per_person_srs, cost_of_living, centrelink_weekly_income):
+    # Works with scalars, or series aligned with the rent series for per row scenarios
+    cost_of_living_proportion_srs = (average_rent_per_person_srs + cost_of_living) / centrelink_weekly_income
 
     return cost_of_living_proportion_srs
 
 
-# Run the below if the dfs needs to be reconstructed
-# average_bedrooms_df = calculate_average_bedrooms_df()
-# average_bedrooms_df.to_csv('../Datasets/Average-Number-of-Bedrooms-Per-Dwelling-Structure-2006-2011-2016-test.csv')
-# average_rent_per_person_df = calculate_average_rent(average_bedrooms_df)
-
-# Otherwise save your poor computer the trouble and load them instead!
-average_bedrooms_df = pd.read_csv('../Datasets/Average-Number-of-Bedrooms-Per-Dwelling-Structure-2006-2011-2016.csv', encoding = 'ISO-8859-1')
-average_bedrooms_df.set_index(['Region', 'Dwelling Structure', 'Census year'], inplace=True)
-average_rent_per_person_df = pd.read_csv('../Datasets/Average-Weekly-Rent-Per-Person-2006-2011-2016.csv')
-
-average_rent_per_person_2011_df = average_rent_per_person_df.loc[
-    average_rent_per_person_df['Census year'] == 2011,
-    :
-]
-
-average_rent_per_person_2016_df = average_rent_per_person_df.loc[
-    average_rent_per_person_df['Census year'] == 2016,
-    :
-]
-# 2011 Cost of living = 75 [Weekly groceries] + 35 [Misc costs like bills, transport etc.]
-# 2011 Youth Allowance/Austudy [388.70 + 79.60 = 468.3 a fortnight]
-cost_of_living_proportion_2011_youth_srs = calculate_cost_proportion(average_rent_per_person_2011_df['Mean rent per person'], 110, 234.15)
-# 2011 Newstart [486.60 + 79.60 = 566.2 a fortnight]
-cost_of_living_proportion_2011_newstart_srs = calculate_cost_proportion(average_rent_per_person_2011_df['Mean rent per person'], 110, 283.1)
-# 2016 Cost of living = 87.5 [Weekly groceries] + 42.5 [Misc costs like bills, transport etc.]
-# 2016 Youth Allowance/Austudy/Newstart under 22 [433.20 + 87.07 = 520.27 a fortnight]
-cost_of_living_proportion_2016_youth_srs = calculate_cost_proportion(average_rent_per_person_2016_df['Mean rent per person'], 130, 260.135)
-# 2016 Newstart/Jobseeker over 22 [528.70 + 87.07 = 615.77]
-cost_of_living_proportion_2016_newstart_srs = calculate_cost_proportion(average_rent_per_person_2016_df['Mean rent per person'], 130, 307.89)
-
-
-average_rent_per_person_df.loc[
-    average_rent_per_person_df['Census year'] == 2011,
-    ['Cost of living proportion (Youth Allowance)']
-] = cost_of_living_proportion_2011_youth_srs
-average_rent_per_person_df.loc[
-    average_rent_per_person_df['Census year'] == 2011,
-    ['Cost of living proportion (Newstart)']
-] = cost_of_living_proportion_2011_newstart_srs
-
-average_rent_per_person_df.loc[
-    average_rent_per_person_df['Census year'] == 2016,
-    ['Cost of living proportion (Youth Allowance)']
-] = cost_of_living_proportion_2016_youth_srs
-average_rent_per_person_df.loc[
-    average_rent_per_person_df['Census year'] == 2016,
-    ['Cost of living proportion (Newstart)']
-] = cost_of_living_proportion_2016_newstart_srs
-
-# cost_of_living_df = average_rent_per_person_2011_df.append(average_rent_per_person_2016_df, ignore_index=True)
-average_rent_per_person_df = average_rent_per_person_df.loc[
-    average_rent_per_person_df['Census year'] != 2006,
-    :
-]
-cost_of_living_df = average_rent_per_person_df.reindex(
-    columns=['Region', 'Census year', 'Mean rent per person', 'Cost of living proportion (Youth Allowance)', 'Cost of living proportion (Newstart)']
-)
-cost_of_living_df.sort_values(by=['Region', 'Census year'], inplace=True)
-
-cost_of_living_df.to_csv('../OutputCSV/Cost-of-Living-By-SA2-Year-2006-2011-2016.csv')
-# cost_of_living_proportion_df.to_csv('../OutputCSV/Adjusted-Cost-of-Living-By-SA2-Year-2006-2011-2016.csv')
+@instrumented
+def add_cost_of_living_proportions(rent_per_person_df, scenarios_df=CENSUS_SCENARIOS):
+    # Adds a 'Cost of living proportion (<Benefit>)' column per benefit, using each row's census year scenario.
+    # Rows in years without a scenario are left as NaN
+    rent_per_person_df = rent_per_person_df.copy()
+    for benefit, benefit_scenarios_df in scenarios_df.groupby('Benefit', sort=False):
+        benefit_scenarios_df = benefit_scenarios_df.set_index('Census year')
+        row_years = rent_per_person_df['Census year']
+        rent_per_person_df['Cost of living proportion ({})'.format(benefit)] = calculate_cost_proportion(
+            rent_per_person_df['Mean rent per person'],
+            row_years.map(benefit_scenarios_df['Cost of living']),
+            row_years.map(weekly_income(benefit_scenarios_df))
+        )
+    return rent_per_person_df
+
+
+@instrumented
+def load_average_rent_per_person_df():
+    # Each stage is keyed on its input csv and the key of the stage feeding it,
+    # so only the stages downstream of a changed input are rebuilt
+    average_bedrooms_key = cache_key('average-bedrooms', [DWELLING_CSV])
+    rent_per_dwelling_key = cache_key(
+        'rent-per-dwelling', [RENT_CSV], {'average bedrooms': average_bedrooms_key}
+    )
+    rent_per_person_key = cache_key(
+        'rent-per-person', params={'rent per dwelling': rent_per_dwelling_key}
+    )
+
+    # Upstream stages are only loaded if the stage that needs them is a cache miss
+    def build_rent_per_dwelling():
+        average_bedrooms_df = load_or_build(average_bedrooms_key, calculate_average_bedrooms_df)
+        return calculate_rent_per_dwelling_df(average_bedrooms_df)
+
+    def build_rent_per_person():
+        rent_per_dwelling_df = load_or_build(rent_per_dwelling_key, build_rent_per_dwelling)
+        return calculate_rent_per_person_df(rent_per_dwelling_df)
+
+    return load_or_build(rent_per_person_key, build_rent_per_person).reset_index()
+
+
+@instrumented
+def build_cost_of_living_df(average_rent_per_person_df, scenarios_df=CENSUS_SCENARIOS, id_columns=('Region',)):
+    # id_columns lead each row, e.g. ('State Code', 'SA2 Code', 'Region') for the national table
+    average_rent_per_person_df = average_rent_per_person_df.loc[
+        average_rent_per_person_df['Census year'] != 2006,
+        :
+    ]
+    average_rent_per_person_df = add_cost_of_living_proportions(average_rent_per_person_df, scenarios_df)
+
+    cost_of_living_df = average_rent_per_person_df.reindex(
+        columns=list(id_columns) + ['Census year', 'Mean rent per person', 'Cost of living proportion (Youth Allowance)', 'Cost of living proportion (Newstart)']
+    )
+    cost_of_living_df.sort_values(by=['Region', 'Census year'], inplace=True)
+
+    return cost_of_living_df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build the rent per person and cost of living tables'
+    )
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=STAGES,
+        default=STAGES,
+        help='Stages to run (default: all)'
+    )
+    parser.add_argument(
+        '--partitioned',
+        action='store_true',
+        help='Process every dwelling and rent extract in Datasets/, a state per process, into the national table'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Worker processes for --partitioned (default: one per CPU)'
+    )
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrumentation.enable_from_arguments(args)
+
+    if args.partitioned:
+        national_rent_per_person_df = load_national_rent_per_person_df(args.jobs)
+        if 'cost-of-living' in args.stages:
+            national_cost_of_living_df = build_cost_of_living_df(
+                national_rent_per_person_df, id_columns=('State Code', 'SA2 Code', 'Region')
+            )
+            OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+            national_cost_of_living_df.to_csv(NATIONAL_COST_OF_LIVING_CSV)
+        return
+
+    average_rent_per_person_df = load_average_rent_per_person_df()
+    if 'cost-of-living' in args.stages:
+        cost_of_living_df = build_cost_of_living_df(average_rent_per_person_df)
+        OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        cost_of_living_df.to_csv(COST_OF_LIVING_CSV)
+        # cost_of_living_proportion_df.to_csv(OUTPUT_DIR / 'Adjusted-Cost-of-Living-By-SA2-Year-2006-2011-2016.csv')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+import paths
+from frame_cache import cache_key, load_or_build
+
+
+## SA2 code conversion and a crosswalk of every SA2 we have data for.
+## 9-digit SA2 main codes are S SS SS SSSS (state, SA4, SA3, SA2) and the
+## 5-digit codes used by the AEDC are the state digit plus the last 4 digits.
+## Everything here works on whole integer arrays rather than per row strings.
+## Codes are ASGS 2016, so 2011 ASGS files aren't used for the crosswalk.
+
+# (file glob, 9-digit code column, name column) of the files the crosswalk is built from
+CROSSWALK_SOURCES = [
+    ('Income-Including-Govt-Allowances-*.csv', 'sa2_maincode_2016', 'sa2_name_2016'),
+    ('AEDC/*.csv', 'sa2_main16', 'name'),
+    ('SA2_Estimating_Homelessness_2016.csv', 'sa2_main16', 'sa2_name_2016'),
+]
+
+# {cache key: crosswalk} so each process only loads it once
+_crosswalk = {}
+
+
+def sa2_main_to_5digit(codes):
+    codes = np.asarray(codes, dtype=np.int64)
+    return (codes // 10**8) * 10**4 + codes % 10**4
+
+
+def to_5digit_index(index):
+    return pd.Index(sa2_main_to_5digit(index.to_numpy()), name=index.name)
+
+
+def read_sa2_codes_and_names(path, code_column, name_column):
+    df = pd.read_csv(
+        path,
+        usecols=lambda heading: heading.strip() in (code_column, name_column)
+    )
+    df.columns = df.columns.str.strip()
+    return pd.DataFrame({
+        'SA2 Main Code': df[code_column].astype(np.int64),
+        'SA2 Name': df[name_column].astype(str).str.strip()
+    })
+
+
+def crosswalk_source_files():
+    return [
+        (path, code_column, name_column)
+        for pattern, code_column, name_column in CROSSWALK_SOURCES
+        for path in sorted(paths.DATASETS_DIR.glob(pattern))
+    ]
+
+
+def build_crosswalk():
+    crosswalk_df = pd.concat(
+        [read_sa2_codes_and_names(*source) for source in crosswalk_source_files()],
+        ignore_index=True
+    ).drop_duplicates('SA2 Main Code')
+
+    main_codes = crosswalk_df['SA2 Main Code'].to_numpy()
+    crosswalk_df['SA2 Code'] = sa2_main_to_5digit(main_codes)
+    crosswalk_df['SA3 Code'] = main_codes // 10**4
+    crosswalk_df['State Code'] = main_codes // 10**8
+    # Sorted by 5-digit code so lookups can binary search it
+    return crosswalk_df.sort_values('SA2 Code').reset_index(drop=True)
+
+
+def get_crosswalk():
+    key = cache_key('sa2-crosswalk', [path for path, _, _ in crosswalk_source_files()])
+    if key not in _crosswalk:
+        _crosswalk[key] = load_or_build(key, build_crosswalk)
+    return _crosswalk[key]
+
+
+def sa2_codes_for_names(names):
+    # 5-digit SA2 codes for an array of SA2 names, <NA> for names not in the crosswalk
+    crosswalk_df = get_crosswalk()
+    positions = pd.Index(crosswalk_df['SA2 Name']).get_indexer(np.asarray(names))
+    codes = pd.array(crosswalk_df['SA2 Code'].to_numpy()[positions], dtype='Int64')
+    codes[positions < 0] = pd.NA
+    return codes
+
+
+def join_on_sa2(*frames):
+    # Inner join of frames indexed by (unique) integer SA2 codes. Each index is
+    # sorted once and rows are matched by binary search instead of a merge
+    sorted_frames = []
+    for frame in frames:
+        assert(frame.index.is_unique)
+        codes = frame.index.to_numpy(dtype=np.int64)
+        order = np.argsort(codes, kind='stable')
+        sorted_frames.append((frame, codes[order], order))
+
+    common_codes = sorted_frames[0][1]
+    for _, sorted_codes, _ in sorted_frames[1:]:
+        common_codes = np.intersect1d(common_codes, sorted_codes, assume_unique=True)
+
+    joined = []
+    for frame, sorted_codes, order in sorted_frames:
+        rows = order[np.searchsorted(sorted_codes, common_codes)]
+        joined.append(frame.iloc[rows].set_axis(pd.Index(common_codes, name=frame.index.name), axis=0))
+    return pd.concat(joined, axis=1)
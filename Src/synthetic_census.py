@@ -0,0 +1,176 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import paths
+from census_schema import CENSUS_SCHEMAS
+
+
+## Synthetic datasets in the same shapes as the ones the scripts read, for any
+## number of SA2s and census years. The dwelling, rent and CPI tables are
+## generated from their label sets. The AURIN csvs (Family and Community,
+## income, AEDC) use the real files in Datasets/ as templates: same headings,
+## same metadata, and each synthetic SA2 gets the rows of a randomly chosen real
+## SA2 with the codes and names replaced, so correlations look like real ones.
+
+CENSUS_YEARS = [2006, 2011, 2016]
+
+DWELLING_STRUCTURES = [
+    'Separate house', 'Semi-detached, row or terrace house, townhouse etc.', 'Flat or apartment',
+    'Other dwelling', 'Total'
+]
+BEDROOM_LABELS = [
+    'None (includes bedsitters)', 'One bedroom', 'Two bedrooms', 'Three bedrooms', 'Four bedrooms',
+    'Five bedrooms', 'Six bedrooms or more', 'Not stated', 'Total'
+]
+RENT_LABELS = [
+    '$1-$74', '$75-$99', '$100-$149', '$150-$199', '$200-$224', '$225-$274', '$275-$349', '$350-$449',
+    '$450-$549', '$550-$649', '$650-$749', '$750-$849', '$850-$949', '$950 and over', 'Nil payments',
+    'Not stated', 'Total'
+]
+
+# AURIN csvs to copy the shape of, relative to the template Datasets/
+AURIN_TEMPLATES = [
+    'Family-and-Community-2011.csv',
+    'Family-and-Community-2016.csv',
+    'income_2011.csv',
+    'income_2016.csv',
+    'Income-Including-Govt-Allowances-*.csv',
+    'AEDC/*.csv',
+]
+# Files that sit next to a template csv and are copied as they are
+SIDECAR_SUFFIXES = ['-metadata.json', '.csv.meta']
+
+# AURIN headings holding SA2 codes and names
+MAIN_CODE_COLUMNS = {'sa2_maincode_2016', 'sa2_main16'}
+CODE_COLUMNS = {'code'}
+NAME_COLUMNS = {'sa2_name_2016', 'name'}
+
+STATE_CODES = np.arange(1, 9)
+
+
+def synthetic_sa2s(n_sa2):
+    # n_sa2 SA2s spread across the states, with valid, unique 9-digit and 5-digit codes
+    position = np.arange(n_sa2)
+    state = STATE_CODES[position % len(STATE_CODES)]
+    # Position of the SA2 within its state
+    k = position // len(STATE_CODES)
+    if k.max(initial=0) >= 8999:
+        raise ValueError('At most {} SA2s can be generated'.format(8999 * len(STATE_CODES)))
+    sa4 = 1 + k // 200
+    sa3 = 1 + (k // 20) % 10
+    main_codes = state * 10**8 + sa4 * 10**6 + sa3 * 10**4 + (1001 + k)
+    return pd.DataFrame({
+        'SA2 Main Code': main_codes,
+        'SA2 Code': state * 10**4 + (1001 + k),
+        'SA2 Name': ['Synthetic SA2 {}'.format(code) for code in main_codes],
+    })
+
+
+def long_format_counts(dimensions, rng, high):
+    # Every combination of the dimension labels ({column: labels}) with a random count
+    index = pd.MultiIndex.from_product(list(dimensions.values()), names=list(dimensions))
+    df = index.to_frame(index=False)
+    df['Value'] = rng.integers(0, high, len(df))
+    return df
+
+
+def generate_dwelling_csv(path, sa2_df, census_years, rng):
+    df = long_format_counts({
+        'Region': sa2_df['SA2 Name'],
+        'Dwelling Structure': DWELLING_STRUCTURES,
+        'Census year': census_years,
+        'Number of Bedrooms': BEDROOM_LABELS,
+    }, rng, 200)
+    df.to_csv(path, index=False, encoding=CENSUS_SCHEMAS['dwelling']['read_csv']['encoding'])
+    return len(df)
+
+
+def generate_rent_csv(path, sa2_df, census_years, rng):
+    df = long_format_counts({
+        'Region': sa2_df['SA2 Name'],
+        'Dwelling Structure': DWELLING_STRUCTURES,
+        'Census year': census_years,
+        'Rent (weekly)': RENT_LABELS,
+    }, rng, 60)
+    df.to_csv(path, index=False)
+    return len(df)
+
+
+def generate_cpi_csv(path, template_path, rng):
+    # Same quarters as the template, with random quarterly increases
+    cpi_df = pd.read_csv(template_path)
+    cpi_df['Percentage increase'] = np.round(rng.normal(0.5, 0.8, len(cpi_df)), 1)
+    cpi_df.to_csv(path, index=False)
+    return len(cpi_df)
+
+
+def template_main_codes(template_path):
+    template_df = pd.read_csv(template_path)
+    return next(
+        template_df[heading].to_numpy() for heading in template_df.columns if heading.strip() in MAIN_CODE_COLUMNS
+    )
+
+
+def generate_aurin_csv(path, template_path, sa2_df, rng):
+    # One row per SA2, copied from the row of its template SA2 (or a random row
+    # if the template doesn't have it), so metrics keep their real relationships
+    template_df = pd.read_csv(template_path)
+    main_code_headings = [heading for heading in template_df.columns if heading.strip() in MAIN_CODE_COLUMNS]
+    positions = pd.Index(template_df[main_code_headings[0]]).get_indexer(sa2_df['Template Code'])
+    missing = positions < 0
+    positions[missing] = rng.integers(0, len(template_df), missing.sum())
+
+    df = template_df.iloc[positions].reset_index(drop=True)
+    for heading in template_df.columns:
+        name = heading.strip()
+        if name in MAIN_CODE_COLUMNS:
+            df[heading] = sa2_df['SA2 Main Code'].to_numpy()
+        elif name in CODE_COLUMNS:
+            df[heading] = sa2_df['SA2 Code'].to_numpy()
+        elif name in NAME_COLUMNS:
+            df[heading] = sa2_df['SA2 Name'].to_numpy()
+    df.to_csv(path, index=False)
+
+    for suffix in SIDECAR_SUFFIXES:
+        sidecar = Path(str(template_path)[:-len('.csv')] + suffix)
+        if sidecar.exists():
+            shutil.copyfile(sidecar, str(path)[:-len('.csv')] + suffix)
+    return len(df)
+
+
+def generate_datasets(datasets_dir, n_sa2, census_years=CENSUS_YEARS, seed=0, template_dir=paths.DATASETS_DIR):
+    # Writes a full synthetic Datasets/ folder, returns {file: rows written}
+    if 2016 not in census_years:
+        raise ValueError('The 2016 census is needed to predict rents from CPI')
+    datasets_dir = Path(datasets_dir)
+    template_dir = Path(template_dir)
+    rng = np.random.default_rng(seed)
+    sa2_df = synthetic_sa2s(n_sa2)
+    # Every synthetic SA2 copies the AURIN rows of a real one
+    sa2_df['Template Code'] = rng.choice(template_main_codes(template_dir / AURIN_TEMPLATES[0]), n_sa2)
+
+    datasets_dir.mkdir(parents=True, exist_ok=True)
+    rows = {
+        CENSUS_SCHEMAS['dwelling']['file']: generate_dwelling_csv(
+            datasets_dir / CENSUS_SCHEMAS['dwelling']['file'], sa2_df, census_years, rng
+        ),
+        CENSUS_SCHEMAS['rent']['file']: generate_rent_csv(
+            datasets_dir / CENSUS_SCHEMAS['rent']['file'], sa2_df, census_years, rng
+        ),
+        'CPI-Housing-Since-2016.csv': generate_cpi_csv(
+            datasets_dir / 'CPI-Housing-Since-2016.csv', template_dir / 'CPI-Housing-Since-2016.csv', rng
+        ),
+    }
+    for pattern in AURIN_TEMPLATES:
+        for template_path in sorted(template_dir.glob(pattern)):
+            relative_path = template_path.relative_to(template_dir)
+            (datasets_dir / relative_path).parent.mkdir(parents=True, exist_ok=True)
+            rows[str(relative_path)] = generate_aurin_csv(datasets_dir / relative_path, template_path, sa2_df, rng)
+
+    with open(datasets_dir / 'synthetic.json', 'w') as file:
+        json.dump({'n_sa2': n_sa2, 'census_years': list(census_years), 'seed': seed, 'rows': rows}, file, indent=1)
+    return rows
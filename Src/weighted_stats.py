@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+
+## Batched weighted means over groups of a long-format dataframe.
+## Everything is done with one groupby to label the rows and np.bincount to
+## accumulate the sums, so there is no per-group Python work.
+
+def group_weighted_mean(df, by, value_col, weight_col, total_name='Total', mean_name='Mean'):
+    # observed=True so categorical keys only give the groups that have rows
+    grouper = df.groupby(by, sort=True, observed=True)
+    # Group number of every row, in the same (sorted) order as the group keys
+    codes = grouper.ngroup().to_numpy()
+    n_groups = grouper.ngroups
+
+    values = df[value_col].to_numpy(dtype=float)
+    weights = df[weight_col].to_numpy(dtype=float)
+    totals = np.bincount(codes, weights=weights, minlength=n_groups)
+    weighted_sums = np.bincount(codes, weights=values * weights, minlength=n_groups)
+
+    # Groups with no weight get a mean of 0 rather than a division by 0
+    means = np.divide(
+        weighted_sums, totals,
+        out=np.zeros(n_groups),
+        where=totals != 0
+    )
+
+    result = pd.DataFrame(
+        {total_name: totals, mean_name: means},
+        index=grouper.size().index
+    )
+    # Keep integer counts as integers
+    if pd.api.types.is_integer_dtype(df[weight_col]):
+        result[total_name] = result[total_name].astype(df[weight_col].dtype)
+    # Some pandas versions give observed categorical groups in order of
+    # appearance even with sort=True, so sort the (few) groups here
+    return result.sort_index()
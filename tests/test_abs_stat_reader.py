@@ -0,0 +1,24 @@
+import pytest
+
+from abs_stat_reader import abs_stat_filters, income_bracket_histograms, stream_abs_stat_csv
+
+
+def published_totals(**filters):
+    # {(REGION, Region): count} from the 'TOT' rows of the extract
+    tot_df = next(stream_abs_stat_csv(
+        filters=dict(abs_stat_filters(**filters), INCP=['TOT']), columns=['REGION', 'Region', 'Value'], chunksize=10**6
+    ))
+    return tot_df.groupby(['REGION', 'Region'], observed=True)['Value'].sum().to_dict()
+
+
+@pytest.mark.parametrize('filters', [{}, {'sex': 'Persons'}, {'age': '15 years and over'}, {'sex': 'Females'}])
+def test_histogram_totals_match_published_totals(filters):
+    # Small chunks so regions are split across them
+    histogram_df = income_bracket_histograms(abs_stat_filters(**filters), chunksize=1000)
+    expected = published_totals(sex=filters.get('sex', 'Persons'), age='15 years and over')
+    assert histogram_df.sum(axis=1).to_dict() == expected
+
+
+def test_histograms_refuse_to_mix_totals_and_parts():
+    with pytest.raises(ValueError):
+        income_bracket_histograms(abs_stat_filters(sex=['Persons', 'Males']))
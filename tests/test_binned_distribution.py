@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from binned_distribution import parse_brackets, binned_quantiles, summarise_histograms, summarise_binned_counts
+
+# Income brackets as they appear in the ABS.Stat extracts, in ascending order,
+# from the zero width nil bracket to the open-ended top one
+LABELS = ['Negative/Nil income', '$1-$199', '$200-$299', '$300-$399', '$400-$599', '$2,000 or more']
+QUANTILES = [0, 0.1, 0.25, 0.5, 0.75, 0.9, 1]
+
+
+def brute_force_quantile(counts, lower, upper, quantile):
+    # Expands every bracket into its people, each given an equal slice of the
+    # bracket, and returns the smallest value by which a share quantile of them is reached
+    slices = [
+        (bracket_lower + i * (bracket_upper - bracket_lower) / count, (bracket_upper - bracket_lower) / count)
+        for count, bracket_lower, bracket_upper in zip(counts, lower, upper)
+        for i in range(int(count))
+    ]
+    if not slices:
+        return np.nan
+    target = quantile * len(slices)
+    if target == 0:
+        return slices[0][0]
+    person = math.ceil(target) - 1
+    start, width = slices[person]
+    return start + (target - person) * width
+
+
+def brute_force_mean(counts, midpoints):
+    people = [midpoint for count, midpoint in zip(counts, midpoints) for _ in range(int(count))]
+    return np.mean(people) if people else np.nan
+
+
+HISTOGRAMS = [
+    [0, 4, 0, 6, 0, 0],
+    # Quantiles landing exactly on a bracket edge (e.g. the median of 5 + 5),
+    # with empty brackets between
+    [0, 5, 0, 0, 5, 0],
+    [3, 0, 0, 1, 0, 4],
+    [0, 0, 0, 0, 0, 7],
+    [1, 1, 1, 1, 1, 1],
+    [0, 0, 0, 0, 0, 0],
+]
+
+
+def test_parse_brackets_edges():
+    brackets_df = parse_brackets(LABELS + ['Personal income not stated', 'Total'])
+    assert brackets_df.loc['$200-$299'].to_list() == [200, 300, 249.5]
+    # Nil is a single value at 0 and the open-ended top bracket sits at its lower bound
+    assert brackets_df.loc['Negative/Nil income'].to_list() == [0, 0, 0]
+    assert brackets_df.loc['$2,000 or more'].to_list() == [2000, 2000, 2000]
+    assert brackets_df.loc[['Personal income not stated', 'Total']].isna().all().all()
+
+
+@pytest.mark.parametrize('counts', HISTOGRAMS)
+def test_binned_quantiles_match_brute_force(counts):
+    brackets_df = parse_brackets(LABELS)
+    estimates = binned_quantiles([counts], brackets_df['Lower'], brackets_df['Upper'], QUANTILES)[0]
+    expected = [brute_force_quantile(counts, brackets_df['Lower'], brackets_df['Upper'], q) for q in QUANTILES]
+    np.testing.assert_allclose(estimates, expected, rtol=1e-12, atol=0)
+
+
+def test_quantile_on_a_bracket_edge_is_the_edge():
+    brackets_df = parse_brackets(LABELS)
+    median = binned_quantiles([[0, 5, 0, 0, 5, 0]], brackets_df['Lower'], brackets_df['Upper'], [0.5])[0, 0]
+    assert median == 200
+
+
+def test_summarise_binned_counts_matches_brute_force():
+    # Long format rows like the extracts, shuffled, with labels out of order and padded
+    rows = [
+        {'Region': 'Region {}'.format(i), 'Bracket': ' {} '.format(label), 'Value': count}
+        for i, counts in enumerate(HISTOGRAMS)
+        for label, count in zip(LABELS, counts)
+    ]
+    rows += [{'Region': 'Region 0', 'Bracket': 'Personal income not stated', 'Value': 9}]
+    df = pd.DataFrame(rows).sample(frac=1, random_state=0)
+    summary_df = summarise_binned_counts(df, ['Region'], 'Bracket', quantiles=(0.25, 0.5, 0.75))
+
+    brackets_df = parse_brackets(LABELS)
+    for i, counts in enumerate(HISTOGRAMS):
+        summary = summary_df.loc['Region {}'.format(i)]
+        # Not stated isn't part of the distribution
+        assert summary['Total'] == sum(counts)
+        np.testing.assert_allclose(summary['Mean'], brute_force_mean(counts, brackets_df['Midpoint']), rtol=1e-12)
+        for quantile, name in [(0.25, 'Q25'), (0.5, 'Median'), (0.75, 'Q75')]:
+            expected = brute_force_quantile(counts, brackets_df['Lower'], brackets_df['Upper'], quantile)
+            np.testing.assert_allclose(summary[name], expected, rtol=1e-12)
+
+
+def test_summarise_histograms_orders_brackets_by_value():
+    brackets_df = parse_brackets(LABELS)
+    histogram_df = pd.DataFrame([HISTOGRAMS[2]], columns=LABELS).iloc[:, ::-1]
+    summary = summarise_histograms(histogram_df, quantiles=[0.5]).iloc[0]
+    expected = brute_force_quantile(HISTOGRAMS[2], brackets_df['Lower'], brackets_df['Upper'], 0.5)
+    assert summary['Median'] == pytest.approx(expected)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import correlation_engine
+from correlation_engine import correlation_matrices, pearson_matrices, sort_columns, ranks_within
+
+
+def scattered_frames(seed=0, n_sa2s=300):
+    rng = np.random.default_rng(seed)
+    sa2_codes = np.arange(20000, 20000 + n_sa2s)
+    metrics_df = pd.DataFrame(rng.normal(size=(n_sa2s, 12)), index=sa2_codes).add_prefix('metric ')
+    income_df = pd.DataFrame(rng.normal(size=(n_sa2s, 3)), index=sa2_codes, columns=['mean', 'median', 'count'])
+    # Gaps scattered through every metric and one income measure, plus ties
+    metrics_df = metrics_df.mask(rng.random(metrics_df.shape) < 0.15)
+    metrics_df['metric 0'] = metrics_df['metric 0'].round()
+    income_df.loc[rng.choice(sa2_codes, 40, replace=False), 'median'] = np.nan
+    income_df['count'] = income_df['count'].round(1)
+    return metrics_df, income_df
+
+
+def pandas_correlations(metrics_df, income_df, method):
+    both_df = pd.concat([metrics_df, income_df], axis=1, join='inner')
+    return both_df.corr(method=method).loc[metrics_df.columns, income_df.columns]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_correlation_matrices_match_pandas_with_scattered_gaps(seed):
+    metrics_df, income_df = scattered_frames(seed)
+    pearson_df, spearman_df, counts_df = correlation_matrices(metrics_df, income_df)
+    pd.testing.assert_frame_equal(pearson_df, pandas_correlations(metrics_df, income_df, 'pearson'))
+    pd.testing.assert_frame_equal(spearman_df, pandas_correlations(metrics_df, income_df, 'spearman'))
+    expected_counts = metrics_df.notna().astype(int).T @ income_df.notna().astype(int)
+    assert (counts_df == expected_counts).all().all()
+
+
+def test_correlation_matrices_match_pandas_without_gaps():
+    metrics_df, income_df = scattered_frames()
+    metrics_df, income_df = metrics_df.fillna(0), income_df.fillna(0)
+    _, spearman_df, _ = correlation_matrices(metrics_df, income_df)
+    pd.testing.assert_frame_equal(spearman_df, pandas_correlations(metrics_df, income_df, 'spearman'))
+
+
+def test_pearson_matrices_match_correlation_matrices():
+    metrics_df, income_df = scattered_frames()
+    pearson_df, counts_df = pearson_matrices(metrics_df, income_df)
+    expected_pearson_df, _, expected_counts_df = correlation_matrices(metrics_df, income_df)
+    pd.testing.assert_frame_equal(pearson_df, expected_pearson_df)
+    pd.testing.assert_frame_equal(counts_df, expected_counts_df)
+
+
+def test_ranks_within_matches_pandas_rank():
+    rng = np.random.default_rng(3)
+    values = rng.integers(0, 6, size=(50, 4)).astype(float)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    present = ~np.isnan(values) & (rng.random(values.shape) < 0.7)
+    expected = pd.DataFrame(np.where(present, values, np.nan)).rank().to_numpy()
+    np.testing.assert_array_equal(ranks_within(sort_columns(values), present), expected)
+    # One column ranked over several masks at once
+    column_sorted = tuple(positions[:, [0]] for positions in sort_columns(values))
+    column_present = present & ~np.isnan(values[:, [0]])
+    expected = pd.DataFrame(np.where(column_present, values[:, [0]], np.nan)).rank().to_numpy()
+    np.testing.assert_array_equal(ranks_within(column_sorted, column_present), expected)
+
+
+def test_spearman_with_a_pattern_per_column_is_batched(monkeypatch):
+    # Every column has its own gaps, which used to mean ranking pair by pair
+    metrics_df, income_df = scattered_frames(4)
+    income_df = income_df.mask(np.random.default_rng(5).random(income_df.shape) < 0.1)
+    metrics_df['all missing'] = np.nan
+    assert len(correlation_engine.missing_patterns(income_df.to_numpy())) == income_df.shape[1]
+
+    calls = []
+    original_ranks_within = correlation_engine.ranks_within
+    monkeypatch.setattr(
+        correlation_engine, 'ranks_within', lambda *args: calls.append(1) or original_ranks_within(*args)
+    )
+    _, spearman_df, _ = correlation_matrices(metrics_df, income_df)
+    # One ranking of the metrics and one of the measure per income measure, not one per pair
+    assert len(calls) == 2 * income_df.shape[1]
+    pd.testing.assert_frame_equal(spearman_df, pandas_correlations(metrics_df, income_df, 'spearman'))
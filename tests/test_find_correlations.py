@@ -0,0 +1,78 @@
+import pandas as pd
+
+import pytest
+
+import paths
+import frame_cache
+from pipeline import PIPELINE_STAGES
+import find_correlations
+from find_correlations import get_LIHS_from_csv, find_income_years, LIHS_year_for, correlation_table_csv, correlations_csv
+
+
+def test_get_LIHS_from_csv_aedc_column_subset():
+    # The AEDC metadata key is the 9-digit main code, not the SA2 code the index is built on
+    full_df = get_LIHS_from_csv('AEDC/Emotional_Maturity.csv')
+    df = get_LIHS_from_csv('AEDC/Emotional_Maturity.csv', columns=['Developmentally Vulnerable (%) 2015'])
+    assert df.index.name == 'SA2 Code'
+    assert df['Developmentally Vulnerable (%) 2015'].equals(full_df['Developmentally Vulnerable (%) 2015'])
+
+
+def test_get_LIHS_from_csv_family_and_community_column_subset():
+    title = 'Households by Type - Census Lone person households (no.)'
+    df = get_LIHS_from_csv('Family-and-Community-2016.csv', columns=[title])
+    assert df.index.name == 'SA2 Code'
+    assert df[title].equals(get_LIHS_from_csv('Family-and-Community-2016.csv')[title])
+
+
+def test_find_income_years_globs_the_releases(tmp_path):
+    for name in ['Income-Including-Govt-Allowances-2019.csv', 'Income-Including-Govt-Allowances-2019-metadata.json',
+                 'Income-Including-Govt-Allowances-2011.csv', 'Income-Including-Govt-Allowances-2011-old.csv']:
+        (tmp_path / name).touch()
+    assert find_income_years(tmp_path) == ['2011', '2019']
+
+
+def test_income_years_are_paired_with_the_nearest_census_year(monkeypatch, tmp_path):
+    monkeypatch.setattr(find_correlations, 'LIHS_years', ['2011', '2016'])
+    for year in ['2011', '2013', '2014', '2019', '2021']:
+        (tmp_path / 'Income-Including-Govt-Allowances-{}.csv'.format(year)).touch()
+    income_years = find_income_years(tmp_path)
+    assert income_years == ['2011', '2013', '2014', '2019', '2021']
+    # 2013 is nearer 2011 and 2014 nearer 2016; releases after the last census use the last census
+    assert [LIHS_year_for(year) for year in income_years] == ['2011', '2011', '2016', '2016', '2016']
+
+
+def test_pipeline_declares_the_correlation_table_output():
+    output = correlation_table_csv().relative_to(paths.DATA_ROOT).as_posix()
+    assert PIPELINE_STAGES['correlation-table'][2] == [output]
+
+
+def test_pipeline_declares_the_correlations_output():
+    output = correlations_csv(find_correlations.LIHS_years).relative_to(paths.DATA_ROOT).as_posix()
+    assert PIPELINE_STAGES['correlations'][2] == [output]
+
+
+@pytest.fixture
+def frame_cache_dir(monkeypatch, tmp_path):
+    # Keeps the frames these tests build out of the repository's cache
+    cache_dir = tmp_path / 'frames'
+    monkeypatch.setattr(
+        find_correlations, 'load_or_build', lambda key, build: frame_cache.load_or_build(key, build, cache_dir=cache_dir)
+    )
+    return cache_dir
+
+
+def test_significance_stage_on_its_own_writes_the_correlations(monkeypatch, tmp_path, frame_cache_dir):
+    monkeypatch.setattr(find_correlations, 'OUTPUT_DIR', tmp_path)
+    find_correlations.main(['--stages', 'significance'])
+    correlations_df = pd.read_csv(find_correlations.correlations_csv(find_correlations.LIHS_years), index_col=0)
+    assert correlations_df.filter(like='p-value').shape[1] > 0
+
+
+def test_cached_year_correlations_still_make_plot_specs(frame_cache_dir):
+    # Plots deleted since the correlations were cached have to be drawn again
+    built_specs, cached_specs = [], []
+    built = find_correlations.load_year_correlations('2016', built_specs)
+    cached = find_correlations.load_year_correlations('2016', cached_specs)
+    pd.testing.assert_frame_equal(built, cached)
+    assert len(built_specs) > 0
+    assert [spec['path'] for spec in cached_specs] == [spec['path'] for spec in built_specs]
@@ -0,0 +1,37 @@
+import pandas as pd
+
+from frame_cache import atomic_write, cache_key, load_or_build
+
+
+def test_cache_key_changes_with_the_code(tmp_path):
+    data_path, code_path = tmp_path / 'input.csv', tmp_path / 'stage.py'
+    data_path.write_text('a\n1\n')
+    code_path.write_text('SCALE = 1\n')
+    key = cache_key('stage', [data_path], {'year': '2016'}, [code_path])
+    assert key == cache_key('stage', [data_path], {'year': '2016'}, [code_path])
+    code_path.write_text('SCALE = 2\n')
+    assert key != cache_key('stage', [data_path], {'year': '2016'}, [code_path])
+
+
+def test_load_or_build_only_builds_once(tmp_path):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return pd.DataFrame({'a': [1, 2]})
+
+    first = load_or_build('stage-key', build, cache_dir=tmp_path)
+    second = load_or_build('stage-key', build, cache_dir=tmp_path)
+    pd.testing.assert_frame_equal(first, second)
+    assert len(builds) == 1
+
+
+def test_atomic_write_leaves_nothing_behind_on_failure(tmp_path):
+    path = tmp_path / 'out.json'
+    try:
+        with atomic_write(path) as temp_path, open(temp_path, 'w') as file:
+            file.write('{')
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,63 @@
+import json
+import argparse
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def instrumented_run(monkeypatch, tmp_path):
+    # A fresh run that doesn't write its report at exit
+    monkeypatch.setattr(instrumentation, '_run', dict(
+        instrumentation._run, enabled=True, profile=False, trace_memory=False, report_dir=tmp_path, run_id='test',
+        records=[]
+    ))
+    monkeypatch.setattr(instrumentation, '_stacks', threading.local())
+    yield instrumentation._run
+    if instrumentation._run['trace_memory']:
+        tracemalloc.stop()
+
+
+@instrumentation.instrumented
+def allocate(size):
+    return len(bytearray(size))
+
+
+@instrumentation.instrumented
+def allocate_on_workers(sizes):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        return list(executor.map(allocate, sizes))
+
+
+def test_stages_on_worker_threads_keep_the_main_thread_peaks(instrumented_run):
+    instrumentation.enable_instrumentation(trace_memory=True)
+    assert allocate_on_workers([2**20] * 16) == [2**20] * 16
+    records = instrumented_run['records']
+    worker_records = [record for record in records if record['thread'] != 'MainThread']
+    (main_record,) = [record for record in records if record['thread'] == 'MainThread']
+    assert len(worker_records) == 16
+    assert all(record['peak_traced_mb'] is None and record['depth'] == 0 for record in worker_records)
+    assert main_record['depth'] == 0
+    assert main_record['peak_traced_mb'] >= 1
+    assert getattr(instrumentation._stacks, 'peaks', []) == []
+
+
+def test_memory_is_only_traced_when_asked_for(instrumented_run):
+    assert allocate(2**20) == 2**20
+    assert not tracemalloc.is_tracing()
+    assert instrumented_run['records'][0]['peak_traced_mb'] is None
+    instrumentation.write_report(instrumented_run['report_dir'] / 'report.json')
+    report = json.loads((instrumented_run['report_dir'] / 'report.json').read_text())
+    assert report['trace_memory'] is False
+
+
+def test_add_arguments():
+    parser = argparse.ArgumentParser()
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args(['--profile'])
+    assert args.profile and not args.instrument and not args.trace_memory
+    assert parser.parse_args(['--trace-memory']).trace_memory
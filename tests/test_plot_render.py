@@ -0,0 +1,19 @@
+import runpy
+
+import plot_render
+import rent_proportion_analysis
+
+
+def test_spec_hash_ignores_the_module_the_script_ran_as():
+    # Running a script directly defines its draw functions in another module ('__main__')
+    script_globals = runpy.run_path(rent_proportion_analysis.__file__, run_name='script')
+    assert script_globals['draw_cost_of_living'].__module__ != rent_proportion_analysis.draw_cost_of_living.__module__
+    imported = plot_render.plot_spec('plot.png', rent_proportion_analysis.draw_cost_of_living, year=2016)
+    run_directly = plot_render.plot_spec('plot.png', script_globals['draw_cost_of_living'], year=2016)
+    assert plot_render.spec_hash(imported) == plot_render.spec_hash(run_directly)
+
+
+def test_spec_hash_changes_with_the_args():
+    spec = plot_render.plot_spec('plot.png', rent_proportion_analysis.draw_cost_of_living, year=2016)
+    other_spec = plot_render.plot_spec('plot.png', rent_proportion_analysis.draw_cost_of_living, year=2011)
+    assert plot_render.spec_hash(spec) != plot_render.spec_hash(other_spec)
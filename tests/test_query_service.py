@@ -0,0 +1,56 @@
+import json
+import threading
+import http.client
+
+import pytest
+
+import query_service
+
+SCENARIO = {'region': 'Abbotsford', 'year': '2021', 'cost_of_living': '150',
+            'fortnightly_payment': '620.8', 'rent_assistance': '93.87'}
+
+
+@pytest.fixture(scope='module')
+def index():
+    return query_service.load_index(1)
+
+
+@pytest.mark.parametrize('name, value', [
+    ('cost_of_living', 'nan'), ('cost_of_living', 'inf'), ('fortnightly_payment', '-Infinity'),
+    ('fortnightly_payment', '-620.8'), ('rent_assistance', '-1'),
+])
+def test_scenario_rejects_bad_numbers(index, name, value):
+    with pytest.raises(ValueError):
+        query_service.scenario_query(index, dict(SCENARIO, **{name: value}))
+
+
+def test_scenario_rejects_zero_income(index):
+    with pytest.raises(ValueError):
+        query_service.scenario_query(index, dict(SCENARIO, fortnightly_payment='0', rent_assistance='0'))
+
+
+def test_scenario_uses_the_index_it_was_given(index):
+    other_index = query_service.load_index(2)
+    other_index['rent'] = other_index['rent'] * 2
+    response = json.loads(query_service.scenario_query(index, SCENARIO))
+    other_response = json.loads(query_service.scenario_query(other_index, SCENARIO))
+    assert (response['version'], other_response['version']) == (1, 2)
+    assert other_response['rows'][0]['Cost of living proportion'] > response['rows'][0]['Cost of living proportion']
+    # Cached responses stay with their index
+    assert json.loads(query_service.scenario_query(index, SCENARIO)) == response
+
+
+def test_bad_scenario_is_a_400_with_valid_json():
+    server = query_service.make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection(*server.server_address)
+        connection.request('GET', '/scenario?region=Abbotsford&year=2021&cost_of_living=nan'
+                                  '&fortnightly_payment=620.8&rent_assistance=93.87')
+        response = connection.getresponse()
+        assert response.status == 400
+        assert 'error' in json.loads(response.read(), parse_constant=pytest.fail)
+    finally:
+        server.shutdown()
+        server.server_close()
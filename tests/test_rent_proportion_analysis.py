@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import paths
+from pipeline import PIPELINE_STAGES
+from rent_proportion_processor import COST_OF_LIVING_CSV
+from rent_proportion_analysis import (
+    load_cpi_factors, cpi_factor_for, count_cost_of_living, predict_rent, PREDICT_YEARS
+)
+
+
+def test_cpi_factor_for_numpy_year_uses_latest_quarter():
+    cpi_factors_srs = load_cpi_factors()
+    quarter, factor = cpi_factor_for(cpi_factors_srs, np.int64(2020))
+    assert str(quarter) == '2020Q4'
+    assert factor == pytest.approx(1.2696, abs=1e-4)
+    assert (quarter, factor) == cpi_factor_for(cpi_factors_srs, 2020)
+
+
+def test_cpi_factor_for_quarter():
+    quarter, factor = cpi_factor_for(load_cpi_factors(), '2020Q1')
+    assert str(quarter) == '2020Q1'
+    assert factor == pytest.approx(1.2902, abs=1e-4)
+
+
+def test_cpi_factor_for_string_year_is_a_year():
+    cpi_factors_srs = load_cpi_factors()
+    assert cpi_factor_for(cpi_factors_srs, '2020') == cpi_factor_for(cpi_factors_srs, 2020)
+    assert cpi_factor_for(cpi_factors_srs, '2020 ') == cpi_factor_for(cpi_factors_srs, 2020)
+
+
+def test_pipeline_declares_the_plots_the_plot_stage_draws():
+    predicted_cost_of_living_df = predict_rent(pd.read_csv(COST_OF_LIVING_CSV), PREDICT_YEARS)
+    drawn = sorted(
+        Path(spec['path']).relative_to(paths.DATA_ROOT).as_posix()
+        for spec in count_cost_of_living(predicted_cost_of_living_df)
+    )
+    assert sorted(PIPELINE_STAGES['cost-of-living-plots'][2]) == drawn
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from weighted_stats import group_weighted_mean
+
+
+def grouped_frame(seed=0, n_rows=400):
+    rng = np.random.default_rng(seed)
+    # Categories listed out of sorted order and rows in random order, so the
+    # order of appearance differs from the sorted group order
+    return pd.DataFrame({
+        'Region': pd.Categorical(rng.choice(['c', 'a', 'd', 'b'], n_rows), categories=['d', 'b', 'c', 'a', 'unused']),
+        'Year': rng.choice([2016, 2006, 2011], n_rows),
+        'Value': rng.normal(100, 20, n_rows),
+        'Weight': rng.integers(1, 50, n_rows),
+    })
+
+
+def expected_means(df, by):
+    grouper = df.groupby(by, sort=True, observed=True)
+    means = grouper.apply(lambda group: np.average(group['Value'], weights=group['Weight']))
+    # Some pandas versions leave observed categorical groups in order of appearance
+    return means.rename('Mean').sort_index()
+
+
+@pytest.mark.parametrize('by', [['Region'], ['Region', 'Year'], ['Year', 'Region']])
+def test_group_weighted_mean_matches_np_average(by):
+    df = grouped_frame()
+    result = group_weighted_mean(df, by, 'Value', 'Weight')
+    expected = expected_means(df, by)
+    # Sorted by the category order, not by order of appearance
+    assert list(result.index) == list(expected.index)
+    np.testing.assert_allclose(result['Mean'], expected, rtol=1e-12)
+    assert result['Total'].dtype == df['Weight'].dtype
+    assert result['Total'].to_list() == df.groupby(by, observed=True)['Weight'].sum().sort_index().to_list()
+
+
+def test_group_weighted_mean_nan_weights():
+    df = grouped_frame(1).astype({'Weight': float})
+    df.loc[df['Region'] == 'b', 'Weight'] = np.nan
+    result = group_weighted_mean(df, ['Region'], 'Value', 'Weight')
+    # A NaN weight leaves its group's total and mean unknown, like np.average
+    assert np.isnan(result.loc['b', ['Total', 'Mean']]).all()
+    others = df.loc[df['Region'] != 'b']
+    others = others.assign(Region=others['Region'].cat.remove_categories('b'))
+    np.testing.assert_allclose(result.drop(index='b')['Mean'], expected_means(others, ['Region']), rtol=1e-12)
+
+
+def test_group_weighted_mean_zero_weight_groups():
+    df = grouped_frame(2)
+    df.loc[df['Region'] == 'a', 'Weight'] = 0
+    result = group_weighted_mean(df, ['Region'], 'Value', 'Weight')
+    # np.average raises for these, the batched version gives a mean of 0
+    assert result.loc['a', 'Total'] == 0
+    assert result.loc['a', 'Mean'] == 0
+    others = df.loc[df['Region'] != 'a']
+    np.testing.assert_allclose(result.drop(index='a')['Mean'], expected_means(others, ['Region']), rtol=1e-12)